@@ -0,0 +1,145 @@
+#
+# genInput.py
+###############################################################################
+#
+#  Purpose:
+#
+#      Generate a synthetic QTL to QTL Interaction input file for the
+#      benchmark. IDs, symbols, terms and JNums match the tables of the
+#      benchmark db stand-in (stubs/db.py populate()).
+#
+#  Usage:
+#
+#      genInput.py  [--lines N] [--error-rate R] [--reciprocal R]
+#		    [--markers N] [--refs N] [--seed N]  outputFile
+#
+#      where:
+#          --lines = number of data lines (default 100000)
+#          --error-rate = fraction of lines with one QC error (default 0.01)
+#          --reciprocal = fraction of pairs that also have the reverse
+#		line (default 0.95)
+#          --markers = number of QTLs MGI:1 .. MGI:N (default 20000)
+#          --refs = number of references J:1 .. J:N (default 5000)
+#          --seed = random seed (default 1)
+#
+###############################################################################
+
+import sys
+import getopt
+import random
+
+USAGE = 'Usage: genInput.py  [--lines N] [--error-rate R] [--reciprocal R] ' + \
+    '[--markers N] [--refs N] [--seed N]  outputFile'
+
+TAB = '\t'
+CRT = '\n'
+
+# interaction terms known to the stand-in
+termList = ['interacts_with', 'epistatic_with', 'suppresses', 'enhances']
+
+header = ['Organizer MGI ID', 'Organizer Symbol', 'Participant MGI ID',
+    'Participant Symbol', 'Interaction', 'JNum', 'Note']
+
+#
+# Purpose: make one line carry one QC error
+# Returns: list of columns
+# Assumes: Nothing
+# Effects: Nothing
+#
+def injectError(rand, columns, markerCount, refCount):
+
+    kind = rand.randrange(6)
+
+    if kind == 0:
+        columns[0] = 'MGI:%d' % (markerCount + rand.randrange(1, 1000))	# not a QTL
+    elif kind == 1:
+        columns[1] = columns[1] + 'x'					# symbol mismatch
+    elif kind == 2:
+        columns[4] = 'no_such_term'					# bad term
+    elif kind == 3:
+        columns[5] = 'J:%d' % (refCount + rand.randrange(1, 1000))	# bad JNum
+    elif kind == 4:
+        columns = columns[:4]						# < 6 columns
+    else:
+        columns[2:4] = columns[0:2]					# org = part
+
+    return columns
+
+# end injectError() -------------------------------
+
+#
+# Purpose: generate the input lines
+# Returns: list of lines, header first
+# Assumes: Nothing
+# Effects: Nothing
+#
+def generate(
+    lines,		# number of data lines
+    errorRate,		# fraction of lines with an error
+    reciprocalRate,	# fraction of pairs with the reverse line
+    markerCount,	# number of QTLs in the stand-in
+    refCount,		# number of references in the stand-in
+    seed		# random seed
+    ):
+
+    rand = random.Random(seed)
+    output = [TAB.join(header) + CRT]
+
+    while len(output) <= lines:
+        org = rand.randrange(1, markerCount + 1)
+        part = rand.randrange(1, markerCount + 1)
+        if org == part:
+            continue
+        term = rand.choice(termList)
+        jNum = 'J:%d' % rand.randrange(1, refCount + 1)
+
+        pairs = [(org, part)]
+        if rand.random() < reciprocalRate:
+            pairs.append((part, org))
+
+        for (o, p) in pairs:
+            columns = ['MGI:%d' % o, 'Qtl%d' % o, 'MGI:%d' % p, 'Qtl%d' % p, term, jNum, '']
+            if rand.random() < errorRate:
+                columns = injectError(rand, columns, markerCount, refCount)
+            output.append(TAB.join(columns) + CRT)
+
+    return output[:lines + 1]
+
+# end generate() -------------------------------
+
+#
+# Purpose: write a synthetic input file
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: writes outputFile
+#
+def writeInput(outputFile, lines = 100000, errorRate = 0.01, reciprocalRate = 0.95,
+        markerCount = 20000, refCount = 5000, seed = 1):
+
+    with open(outputFile, 'w') as fp:
+        fp.writelines(generate(lines, errorRate, reciprocalRate, markerCount, refCount, seed))
+
+    return 0
+
+# end writeInput() -------------------------------
+
+if __name__ == '__main__':
+
+    try:
+        optList, args = getopt.getopt(sys.argv[1:], '',
+            ['lines=', 'error-rate=', 'reciprocal=', 'markers=', 'refs=', 'seed='])
+        options = dict(optList)
+        if len(args) != 1:
+            raise getopt.GetoptError('missing outputFile')
+        writeInput(args[0],
+            lines = int(options.get('--lines', 100000)),
+            errorRate = float(options.get('--error-rate', 0.01)),
+            reciprocalRate = float(options.get('--reciprocal', 0.95)),
+            markerCount = int(options.get('--markers', 20000)),
+            refCount = int(options.get('--refs', 5000)),
+            seed = int(options.get('--seed', 1)))
+    except (getopt.GetoptError, ValueError):
+        print(USAGE)
+        sys.exit(1)
+
+    sys.exit(0)
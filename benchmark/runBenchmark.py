@@ -0,0 +1,233 @@
+#
+# runBenchmark.py
+###############################################################################
+#
+#  Purpose:
+#
+#      Benchmark the QC (qtlIntQC.py) and the load (qtlinteractionload.py:
+#      bcp generation, COPY and verification) on a synthetic input file,
+#      against the in-memory db stand-in in benchmark/stubs - no database
+#      is needed.
+#
+#      For each phase it reports wall and CPU seconds, lines/sec, the
+#      peak Python memory of the phase (tracemalloc) and the number of
+#      db round trips, so a change can be compared with the baseline
+#      before it goes to production.
+#
+#  Usage:
+#
+#      runBenchmark.py  [--lines N] [--error-rate R] [--reciprocal R]
+#		       [--workers N] [--repeat N] [--json file] [--keep]
+#
+#      where:
+#          --lines, --error-rate, --reciprocal = see genInput.py
+#          --workers = QC worker processes (QC_WORKERS, default 1)
+#          --repeat = runs per phase; the fastest is reported (default 1)
+#          --json = also write the results as JSON to file
+#          --keep = keep the generated input and the outputs
+#
+#  Notes:
+#
+#      The QC runs on the input with errors; the bcp generation runs on
+#      the same input generated without errors, as the load only runs
+#      on a file that passed QC. tracemalloc slows the run down, so
+#      compare runs with each other, not with production timings.
+#
+###############################################################################
+
+import sys
+import os
+import time
+import json
+import getopt
+import shutil
+import tempfile
+import resource
+import tracemalloc
+
+benchmarkDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarkDir, 'stubs'))
+sys.path.insert(0, os.path.join(os.path.dirname(benchmarkDir), 'bin'))
+sys.path.insert(0, benchmarkDir)
+
+import db
+import genInput
+
+USAGE = 'Usage: runBenchmark.py  [--lines N] [--error-rate R] [--reciprocal R] ' + \
+    '[--workers N] [--repeat N] [--json file] [--keep]'
+
+# stand-in table sizes
+markerCount = 20000
+refCount = 5000
+
+# results [{script, phase, wall, cpu, rows, linesPerSec, peakMb, dbCalls}, ...]
+results = []
+
+#
+# Purpose: run and measure one phase
+# Returns: the value returned by function
+# Assumes: tracemalloc is started
+# Effects: appends to results
+#
+def measure(script, phase, lines, function, *args):
+
+    tracemalloc.reset_peak()
+    dbCalls = db.callCount
+    startWall = time.perf_counter()
+    startCpu = time.process_time()
+
+    value = function(*args)
+
+    wall = time.perf_counter() - startWall
+    results.append({'script' : script, 'phase' : phase,
+        'wall' : wall, 'cpu' : time.process_time() - startCpu,
+        'rows' : lines, 'linesPerSec' : lines / wall if wall > 0 else 0,
+        'peakMb' : tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0),
+        'dbCalls' : db.callCount - dbCalls})
+
+    return value
+
+# end measure() -------------------------------
+
+#
+# Purpose: benchmark the QC phases
+# Returns: Nothing
+# Assumes: the environment is set for qtlIntQC
+# Effects: writes the QC report in the work directory
+#
+def benchQc(inputFile, lines):
+
+    import qtlIntLib
+    import qtlIntQC
+
+    qtlIntQC.inputFile = inputFile
+    measure('qtlIntQC', 'init', lines, qtlIntQC.init)
+    measure('qtlIntQC', 'runQcChecks', lines, qtlIntQC.runQcChecks)
+    measure('qtlIntQC', 'writeReport', lines, qtlIntQC.writeReport)
+    qtlIntQC.closeFiles()
+
+    # the load resolves its own lookups
+    qtlIntLib.openSnapshots.clear()
+
+    return 0
+
+# end benchQc() -------------------------------
+
+#
+# Purpose: benchmark the load
+# Returns: Nothing
+# Assumes: the environment is set for qtlinteractionload
+# Effects: writes the bcp file in the work directory, loads it into
+#	the stand-in; exits if the loaded relationships do not verify
+#
+def benchLoad(lines):
+
+    import qtlIntLib
+    import qtlinteractionload
+
+    measure('qtlinteractionload', 'initialize', lines, qtlinteractionload.initialize)
+    records = measure('qtlinteractionload', 'readRecords', lines,
+        qtlIntLib.readRecords, qtlinteractionload.fpInputFile)
+    measure('qtlinteractionload', 'processRelationships', lines,
+        qtlinteractionload.processRelationships, records)
+    measure('qtlinteractionload', 'doDeletes', lines, qtlinteractionload.doDeletes)
+    qtlinteractionload.closeFiles()
+    measure('qtlinteractionload', 'bcpFiles', lines, qtlinteractionload.bcpFiles)
+
+    # the stand-in evaluates the checksum query independently of
+    # qtlIntLib.rowChecksum(), so this also checks that the two agree
+    if measure('qtlinteractionload', 'verifyLoad', lines, qtlinteractionload.verifyLoad) != 0:
+        print('verifyLoad failed: the loaded relationships do not match, see %s' % \
+            qtlinteractionload.diagFileName)
+        sys.exit(1)
+
+    return 0
+
+# end benchLoad() -------------------------------
+
+#
+# Purpose: print the results
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: writes to stdout
+#
+def report(lines):
+
+    print('%d lines, peak RSS %d KB' % (lines, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+    print('%-20s %-22s %9s %9s %12s %9s %8s' % \
+        ('Script', 'Phase', 'Wall(s)', 'CPU(s)', 'Lines/sec', 'Peak(MB)', 'DbCalls'))
+    for r in results:
+        print('%-20s %-22s %9.3f %9.3f %12.0f %9.1f %8d' % \
+            (r['script'], r['phase'], r['wall'], r['cpu'], r['linesPerSec'], r['peakMb'], r['dbCalls']))
+
+    return 0
+
+# end report() -------------------------------
+
+if __name__ == '__main__':
+
+    try:
+        optList, args = getopt.getopt(sys.argv[1:], '',
+            ['lines=', 'error-rate=', 'reciprocal=', 'workers=', 'repeat=', 'json=', 'keep'])
+        options = dict(optList)
+        lines = int(options.get('--lines', 100000))
+        errorRate = float(options.get('--error-rate', 0.01))
+        reciprocalRate = float(options.get('--reciprocal', 0.95))
+        repeat = int(options.get('--repeat', 1))
+        if args:
+            raise getopt.GetoptError('unexpected arguments')
+    except (getopt.GetoptError, ValueError):
+        print(USAGE)
+        sys.exit(1)
+
+    workDir = tempfile.mkdtemp(prefix = 'qtlintbench.')
+    qcInput = os.path.join(workDir, 'qc_input.txt')
+    loadInput = os.path.join(workDir, 'load_input.txt')
+    genInput.writeInput(qcInput, lines, errorRate, reciprocalRate, markerCount, refCount)
+    genInput.writeInput(loadInput, lines, 0, reciprocalRate, markerCount, refCount)
+
+    # the scripts read their configuration at import
+    os.environ['QC_RPT'] = os.path.join(workDir, 'qc.rpt')
+    os.environ['INPUT_FILE_DEFAULT'] = loadInput
+    os.environ['OUTPUTDIR'] = workDir
+    os.environ['QC_WORKERS'] = options.get('--workers', '1')
+    os.environ['LOOKUP_CONNECTIONS'] = '1'
+    os.environ['BCP_METHOD'] = 'copy'
+    for name in ['QC_JSON', 'LOOKUP_CACHE', 'LASTRUN_FILE', 'LOGDIR', 'LOG_DEBUG', 'PROFILE_RUN', 'LOAD_MODE']:
+        os.environ.pop(name, None)
+
+    db.populate(markerCount, genInput.termList, refCount)
+    tracemalloc.start()
+
+    # each repeat re-imports the scripts so their globals start empty;
+    # keep the fastest run of each phase
+    best = {}
+    sql = db.sql
+    for i in range(repeat):
+        for name in ['qtlIntQC', 'qtlinteractionload', 'qtlIntLib']:
+            sys.modules.pop(name, None)
+        # qtlIntLib wraps db.sql again on import
+        db.sql = sql
+        del results[:]
+        benchQc(qcInput, lines)
+        benchLoad(lines)
+        for r in results:
+            key = (r['script'], r['phase'])
+            if key not in best or r['wall'] < best[key]['wall']:
+                best[key] = r
+    results[:] = [best[(r['script'], r['phase'])] for r in results]
+
+    tracemalloc.stop()
+    report(lines)
+
+    if '--json' in options:
+        with open(options['--json'], 'w') as fp:
+            json.dump({'lines' : lines, 'errorRate' : errorRate,
+                'reciprocalRate' : reciprocalRate, 'results' : results}, fp, indent = 1)
+
+    if '--keep' in options:
+        print('work directory: %s' % workDir)
+    else:
+        shutil.rmtree(workDir, ignore_errors = True)
+
+    sys.exit(0)
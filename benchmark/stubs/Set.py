@@ -0,0 +1,10 @@
+#
+# Set.py
+###############################################################################
+#
+#  Purpose:
+#
+#      Stand-in for the Set module (imported, not used, by qtlIntQC.py),
+#      used only by the benchmark
+#
+###############################################################################
@@ -0,0 +1,234 @@
+#
+# db.py
+###############################################################################
+#
+#  Purpose:
+#
+#      In-memory stand-in for the pg db module, used only by the benchmark
+#      (see benchmark/runBenchmark.py). It answers the queries issued by
+#      qtlIntQC.py, qtlinteractionload.py and qtlIntLib.py from tables
+#      built by populate(); it is not a SQL engine.
+#
+#  Usage:
+#
+#      sys.path.insert(0, 'benchmark/stubs')
+#      import db
+#      db.populate(markerCount, terms, refCount)
+#
+###############################################################################
+
+import re
+import hashlib
+
+# {accid: (_marker_key, symbol), ...} - official QTLs
+markers = {}
+
+# {term: _term_key, ...} - vocab 178
+terms = {}
+
+# {J:nnn accid: _object_key, ...}
+references = {}
+
+# rows of MGI_Relationship created by the load
+# [(_relationship_key, _object_key_1, _object_key_2, _relationshipterm_key,
+#	_qualifier_key, _evidence_key, _refs_key, _category_key,
+#	_createdby_key), ...]
+relationshipColumns = ['_relationship_key', '_object_key_1', '_object_key_2',
+    '_relationshipterm_key', '_qualifier_key', '_evidence_key', '_refs_key',
+    '_category_key', '_createdby_key']
+relationships = []
+
+# last value handed out by mgi_relationship_seq
+sequence = 0
+
+# number of sql() calls and COPY batches
+callCount = 0
+
+sqlLogAll = None
+sharedDbConnection = None
+
+#
+# Purpose: build the stand-in tables
+# Returns: Nothing
+# Assumes: the synthetic input uses the same naming - see genInput.py
+# Effects: replaces the module tables
+#
+def populate(
+    markerCount,	# number of official QTLs MGI:1 .. MGI:markerCount
+    termList,		# interaction terms
+    refCount		# number of references J:1 .. J:refCount
+    ):
+    global markers, terms, references
+
+    markers = dict([('MGI:%d' % i, (1000000 + i, 'Qtl%d' % i)) for i in range(1, markerCount + 1)])
+    terms = dict([(t, 500 + i) for (i, t) in enumerate(termList)])
+    references = dict([('J:%d' % i, 2000000 + i) for i in range(1, refCount + 1)])
+
+    return 0
+
+# end populate() -------------------------------
+
+def useOneConnection(value):
+    global sharedDbConnection
+
+    if value and sharedDbConnection is None:
+        sharedDbConnection = Connection()
+
+def set_sqlLogFunction(function):
+    pass
+
+def setTrace():
+    pass
+
+def get_sqlServer():
+    return 'benchmark'
+
+def get_sqlDatabase():
+    return 'memory'
+
+def commit():
+    pass
+
+#
+# Purpose: values of the first 'in (...)' clause of a query
+# Returns: list of unquoted values, None if there is no 'in' clause
+#
+def inValues(cmd):
+
+    match = re.search(r"\bin \(([^)]*)\)", cmd)
+    if match is None:
+        return None
+
+    return [str.replace(v.strip()[1:-1], "''", "'") if v.strip().startswith("'") else v.strip()
+        for v in str.split(match.group(1), ',')]
+
+# end inValues() -------------------------------
+
+#
+# Purpose: evaluate the checksum aggregate of qtlIntLib.checksumSql() the
+#	way postgres does: the first 16 hex digits of the md5 of the
+#	'|' joined columns, read as a signed 64 bit integer, summed
+# Returns: dictionary {rowCount, checksum} of the matching relationships
+# Assumes: cmd selects count(*) and the checksum from MGI_Relationship
+#	restricted by _category_key and _createdby_key
+#
+def relationshipChecksum(c):
+
+    columns = [str.strip(name) for name in
+        str.split(re.search(r"concat_ws\('\|', ([^)]*)\)", c).group(1), ',')]
+    positions = [relationshipColumns.index(name) for name in columns]
+    category = int(re.search(r'_category_key = (\d+)', c).group(1))
+    createdBy = int(re.search(r'_createdby_key = (\d+)', c).group(1))
+
+    rowCount = 0
+    checksum = 0
+    for r in relationships:
+        if r[7] != category or r[8] != createdBy:
+            continue
+        text = '|'.join([str(r[k]) for k in positions])
+        checksum += int.from_bytes(hashlib.md5(text.encode('utf-8')).digest()[:8], 'big', signed = True)
+        rowCount += 1
+
+    return {'rowCount' : rowCount, 'checksum' : checksum}
+
+# end relationshipChecksum() -------------------------------
+
+#
+# Purpose: answer a query from the stand-in tables
+# Returns: list of dictionaries, as db.sql(cmd, 'auto')
+# Assumes: cmd is one of the queries issued by the load scripts
+# Effects: may change relationships and sequence
+# Throws: ValueError for a query the stand-in does not know
+#
+def sql(cmd, parser = 'auto'):
+    global callCount, sequence, relationships
+
+    callCount += 1
+    c = ' '.join(str.split(cmd)).lower()
+    values = inValues(cmd)
+
+    if 'generate_series' in c:
+        count = int(re.search(r'generate_series\(1, (\d+)\)', c).group(1))
+        keys = [{'nextKey' : sequence + i + 1} for i in range(count)]
+        sequence += count
+        return keys
+
+    if 'union all' in c:
+        return [{'kind' : 'marker', 'rowCount' : len(markers), 'modDate' : None},
+            {'kind' : 'term', 'rowCount' : len(terms), 'modDate' : None},
+            {'kind' : 'reference', 'rowCount' : len(references), 'modDate' : None}]
+
+    if '_mgitype_key = 2' in c:
+        keys = markers if values is None else values
+        return [{'accid' : k, '_marker_key' : markers[k][0], 'symbol' : markers[k][1]}
+            for k in keys if k in markers]
+
+    if '_vocab_key = 178' in c:
+        keys = terms if values is None else values
+        return [{'term' : k, '_term_key' : terms[k]} for k in keys if k in terms]
+
+    if '_mgitype_key = 1' in c:
+        keys = references if values is None else values
+        return [{'accid' : k, '_object_key' : references[k]} for k in keys if k in references]
+
+    if c.startswith('select _relationship_key'):
+        return [dict(zip(relationshipColumns[:7], r)) for r in relationships]
+
+    if ' as checksum' in c:
+        return [relationshipChecksum(c)]
+
+    if c.startswith('delete'):
+        if values is None:
+            relationships = []
+        else:
+            deleteKeys = set(map(int, values))
+            relationships = [r for r in relationships if r[0] not in deleteKeys]
+        return []
+
+    if c.startswith('create') or c.startswith('insert') or c.startswith('drop'):
+        return []
+
+    raise ValueError('benchmark db stand-in does not know: %s' % c[:120])
+
+# end sql() -------------------------------
+
+#
+# Cursor
+#
+class Cursor:
+    # Is: a cursor of the stand-in connection
+    # Has: rowcount of the last COPY
+    # Does: accepts COPY FROM STDIN into MGI_Relationship
+
+    def __init__(self):
+        self.rowcount = -1
+
+    def copy_expert(self, cmd, fp):
+        global callCount
+
+        callCount += 1
+        rows = [str.split(line, '|') for line in str.splitlines(fp.read())]
+        # bcp columns: key, category, organizer, participant, term,
+        # qualifier, evidence, reference, createdby, ...
+        if 'mgi_relationship' in cmd.lower():
+            relationships.extend([tuple(map(int, [r[0]] + r[2:8] + [r[1], r[8]])) for r in rows])
+        self.rowcount = len(rows)
+
+    def execute(self, cmd, args = None):
+        pass
+
+    def close(self):
+        pass
+
+# end class Cursor -------------------------------
+
+class Connection:
+    # Is: the stand-in shared connection
+
+    def cursor(self):
+        return Cursor()
+
+    def commit(self):
+        pass
+
+# end class Connection -------------------------------
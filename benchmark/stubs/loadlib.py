@@ -0,0 +1,13 @@
+#
+# loadlib.py
+###############################################################################
+#
+#  Purpose:
+#
+#      Stand-in for the loadlib module, used only by the benchmark
+#
+###############################################################################
+
+import time
+
+loaddate = time.strftime('%m/%d/%Y')
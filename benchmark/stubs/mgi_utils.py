@@ -0,0 +1,14 @@
+#
+# mgi_utils.py
+###############################################################################
+#
+#  Purpose:
+#
+#      Stand-in for the mgi_utils module, used only by the benchmark
+#
+###############################################################################
+
+import time
+
+def date(format = '%c'):
+    return time.strftime(format)
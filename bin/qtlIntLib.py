@@ -0,0 +1,1309 @@
+#
+# qtlIntLib.py
+###############################################################################
+#
+#  Purpose:
+#
+#      Shared classes and functions for the QTL to QTL Interaction QC
+#      and load scripts
+#
+#  Usage:
+#
+#      import qtlIntLib
+#
+#  History:
+#
+# sc	10/17/2026
+#	- created
+#
+###############################################################################
+
+import os
+import sys
+import io
+import time
+import json
+import hashlib
+import pickle
+import shutil
+import tempfile
+import resource
+import cProfile
+import concurrent.futures
+import db
+
+# number of values per 'in' clause when querying in bulk
+batchSize = 500
+
+# when the input references more than this fraction of a lookup table
+# the whole table is loaded instead of only the values in the input
+scopeFraction = float(os.getenv('LOOKUP_SCOPE_FRACTION', '0.2'))
+
+# database connections for loading whole lookup tables concurrently;
+# 1 loads them one after another on the shared connection
+queryConnections = int(os.getenv('LOOKUP_CONNECTIONS', '3'))
+
+# file for the diagnostics lines of this module; the scripts with a
+# diagnostics file point this at it
+fpDiag = sys.stdout
+
+TAB = '\t'
+
+# bytes read from the input file at a time
+inputBufferSize = 1024 * 1024
+
+# trailing whitespace removed from input lines; tabs separate the
+# columns, so a line keeps its trailing empty columns
+trailingSpace = ' \r\n\x0b\x0c\x85\xa0\u200b\u3000'
+
+# bytes of a QC report section kept in memory before spooling to disk
+spoolSize = 1024 * 1024
+
+# bump when the layout of the lookup snapshot changes
+snapshotVersion = 1
+
+# lookup kinds held in the snapshot
+# {kind: (full table query, column for the 'in' clause, key column,
+#	value columns), ...}
+lookupQueries = {
+    'marker' : ('''select a.accid, m._marker_key, m.symbol
+        from acc_accession a, mrk_marker m
+        where m._marker_type_key = 6 --qtl
+        and m._marker_status_key = 1 -- official
+        and m._marker_key = a._object_key
+        and a._mgitype_key = 2
+        and a._logicaldb_key = 1
+        and a.preferred = 1
+        and a.private = 0
+        and a.prefixPart = 'MGI:' ''', 'a.accid', 'accid', ('_marker_key', 'symbol')),
+
+    'term' : ('''select t.term, t._term_key
+        from voc_term t
+        where t._vocab_key = 178 -- QTL Interactions
+        ''', 't.term', 'term', ('_term_key',)),
+
+    'reference' : ('''select a.accid, a._object_key
+        from acc_accession a
+        where a._mgitype_key = 1
+        and a._logicaldb_key = 1
+        and a.preferred = 1
+        and a.private = 0
+        and a.prefixPart = 'J:' ''', 'a.accid', 'accid', ('_object_key',)),
+    }
+
+# freshness probe for the snapshot: row count and last modification
+# of the tables behind each lookup kind
+probeCmd = '''select 'marker' as kind, count(*) as rowCount, max(m.modification_date) as modDate
+    from mrk_marker m
+    where m._marker_type_key = 6
+    union all
+    select 'term' as kind, count(*) as rowCount, max(t.modification_date) as modDate
+    from voc_term t
+    where t._vocab_key = 178
+    union all
+    select 'reference' as kind, count(*) as rowCount, max(a.modification_date) as modDate
+    from acc_accession a
+    where a._mgitype_key = 1
+    and a._logicaldb_key = 1
+    and a.prefixPart = 'J:' '''
+
+#
+# Lookup
+#
+class Lookup(dict):
+    # Is: a read-only hashed lookup built once from query results
+    # Has: a mapping of key to value
+    # Does: constant time membership tests and value lookups;
+    #	membership and item access are the built-in dict operations,
+    #	any attempt to modify the lookup raises TypeError
+
+    def readOnly(self, *args, **kwargs):
+        raise TypeError('Lookup is read-only')
+
+    __setitem__ = __delitem__ = readOnly
+    clear = pop = popitem = setdefault = update = readOnly
+
+# end class Lookup -------------------------------
+
+#
+# InputRow
+#
+class InputRow:
+    # Is: one parsed line of the input file
+    # Has: line number, the line as read (for the QC report), and its
+    #	first six stripped tab-separated columns (a tuple), the ones
+    #	the QC and the load use; they are interned, so an ID, symbol,
+    #	term or JNum repeated across the file is stored once. The
+    #	curator columns after the sixth are not kept.
+    # Does: nothing - the QC sections, the reciprocal index and the load
+    #	refer to rows by their index in the list from readRecords()
+
+    __slots__ = ('lineNum', 'line', 'columns')
+
+    def __init__(self, lineNum, line):
+        # the curator columns are left in one unsplit piece
+        columns = str.split(line, TAB, 6)[:6]
+
+        self.lineNum = lineNum
+        self.line = line
+        self.columns = tuple([sys.intern(str.strip(c)) for c in columns])
+
+# end class InputRow -------------------------------
+
+# Purpose: open an input file for the QC and the load; the file is
+#     streamed through a large buffer and normalized as it is read:
+#     a UTF-8 byte order mark is dropped, CRLF and CR line endings
+#     read as LF, and bytes that are not UTF-8 read as U+FFFD.
+#     The file itself is never modified.
+# Returns: text file object
+# Assumes: Nothing
+# Effects: opens the input file
+# Throws: IOError/OSError if the file cannot be opened
+#
+def openInput(
+    fileName		# input file (str.)
+    ):
+
+    return open(fileName, 'r', buffering = inputBufferSize,
+        encoding = 'utf-8-sig', errors = 'replace', newline = None)
+
+# end openInput() -------------------------------
+
+# Purpose: read the lines of the input file unparsed, for checks that
+#     parse them in chunks; the first line is a header. The whole file
+#     is held in memory - readRecords() streams it instead.
+# Returns: list of lines as read, in file order, without the header
+# Assumes: 'fp' is positioned at the start of the file and was opened
+#     with openInput()
+# Effects: reads the input file
+#
+def readLines(fp):
+
+    header = fp.readline()
+
+    return [line for line in fp]
+
+# end readLines() -------------------------------
+
+# Purpose: parse one input line. Trailing whitespace other than tabs
+#     is removed and the line ends with LF.
+# Returns: InputRow
+# Assumes: Nothing
+# Effects: Nothing
+#
+def parseLine(
+    lineNum,	# line number in the file, the header is line 1
+    line	# the line as read
+    ):
+
+    return InputRow(lineNum, str.rstrip(line, trailingSpace) + '\n')
+
+# end parseLine() -------------------------------
+
+# Purpose: parse the input file; the first line is a header. Each
+#     line is parsed as it is read through the openInput() buffer, so
+#     only the parsed rows are held in memory.
+# Returns: list of InputRow, in file order
+# Assumes: 'fp' is positioned at the start of the file and was opened
+#     with openInput()
+# Effects: reads the input file
+#
+def readRecords(fp):
+
+    header = fp.readline()
+
+    return [parseLine(lineNum, line) for (lineNum, line) in enumerate(fp, 2)]
+
+# end readRecords() -------------------------------
+
+# Purpose: digest of the load columns of the input; ignores line
+#     endings, the whitespace around values and the curator columns
+# Returns: hex digest (str.)
+# Assumes: Nothing
+# Effects: Nothing
+#
+def inputDigest(
+    records	# parsed input [InputRow, ...]
+    ):
+
+    digest = hashlib.sha1()
+    for row in records:
+        digest.update(('\t'.join(row.columns) + '\n').encode('utf-8', 'replace'))
+
+    return digest.hexdigest()
+
+# end inputDigest() -------------------------------
+
+# Purpose: order-independent digest of a set of resolved relationships
+# Returns: hex digest (str.)
+# Assumes: Nothing
+# Effects: Nothing
+#
+def keySetDigest(
+    relationships	# iterable of tuples of keys
+    ):
+
+    digest = hashlib.sha1()
+    for r in sorted(relationships):
+        digest.update(('%s\n' % '|'.join(map(str, r))).encode('ascii'))
+
+    return digest.hexdigest()
+
+# end keySetDigest() -------------------------------
+
+# Purpose: order-independent checksum of a set of rows: the sum of the
+#     first 64 bits of the md5 of each row's '|'-joined values, read as
+#     a signed bigint. checksumSql() computes the same value in the
+#     database, so loaded rows can be verified with one aggregate query.
+# Returns: tuple (row count, checksum)
+# Assumes: the values format the same in Python and in the database
+#     e.g. integer keys
+# Effects: Nothing
+#
+def rowChecksum(
+    rows	# iterable of tuples of values
+    ):
+
+    count = 0
+    checksum = 0
+
+    for r in rows:
+        value = int(hashlib.md5('|'.join(map(str, r)).encode('utf-8')).hexdigest()[:16], 16)
+        if value >= 1 << 63:
+            value -= 1 << 64
+        checksum += value
+        count += 1
+
+    return (count, checksum)
+
+# end rowChecksum() -------------------------------
+
+# Purpose: the aggregate expression that computes rowChecksum() over
+#     columns of a table
+# Returns: sql expression (str.)
+# Assumes: Nothing
+# Effects: Nothing
+#
+def checksumSql(
+    columns	# column names, in the order of the rowChecksum() tuples
+    ):
+
+    return '''coalesce(sum(('x' || substr(md5(concat_ws('|', %s)), 1, 16))::bit(64)::bigint), 0)''' % \
+        ', '.join(columns)
+
+# end checksumSql() -------------------------------
+
+# Purpose: read a file of 'name digest' lines
+# Returns: dictionary {name: digest, ...}; empty if there is no file
+# Assumes: Nothing
+# Effects: reads the file
+#
+def readDigests(fileName):
+
+    digests = {}
+
+    if not fileName or not os.path.exists(fileName):
+        return digests
+
+    with open(fileName, 'r') as fp:
+        for line in fp:
+            tokens = str.split(line)
+            if len(tokens) == 2:
+                digests[tokens[0]] = tokens[1]
+
+    return digests
+
+# end readDigests() -------------------------------
+
+# Purpose: write a file of 'name digest' lines
+# Returns: nothing
+# Assumes: Nothing
+# Effects: writes the file
+#
+def writeDigests(fileName, digests):
+
+    if not fileName:
+        return 0
+
+    with open(fileName, 'w') as fp:
+        for name in sorted(digests):
+            fp.write('%s %s\n' % (name, digests[name]))
+
+    return 0
+
+# end writeDigests() -------------------------------
+
+# Purpose: normalize an accession ID for the pair index
+# Returns: the numeric part of an 'MGI:nnn' ID (int), otherwise the ID
+# Assumes: Nothing
+# Effects: Nothing
+#
+def idKey(accID):
+
+    prefix, sep, number = str.partition(accID, ':')
+    if sep and prefix == 'MGI' and str.isdigit(number):
+        return int(number)
+
+    return accID
+
+# end idKey() -------------------------------
+
+# Purpose: quote a collection of values for use in a sql 'in' clause
+# Returns: comma separated string of quoted values
+# Assumes: Nothing
+# Effects: Nothing
+#
+def sqlInList(values):
+
+    return ','.join(["'%s'" % str.replace(v, "'", "''") for v in values])
+
+# end sqlInList() -------------------------------
+
+# Purpose: get the connection the db module is using
+# Returns: DB-API connection
+# Assumes: db.useOneConnection(1) is in effect
+# Effects: opens the shared connection if it is not open yet
+#
+def getConnection():
+
+    if getattr(db, 'sharedDbConnection', None) is None:
+        db.sql('select 1', 'auto')
+
+    connection = getattr(db, 'sharedDbConnection', None)
+    if connection is None:
+        raise Exception('no shared database connection; db.useOneConnection(1) is required')
+
+    return connection
+
+# end getConnection() -------------------------------
+
+# Purpose: open a separate connection to the database the db module
+#     uses, as the same user with the same password
+# Returns: DB-API connection
+# Assumes: Nothing; without a db module password libpq looks one up
+#     (PGPASSFILE/.pgpass)
+# Effects: connects to the database
+# Throws: ImportError, psycopg2 errors
+#
+def newConnection():
+
+    import psycopg2
+
+    user = db.get_sqlUser() if hasattr(db, 'get_sqlUser') else None
+    password = db.get_sqlPassword() if hasattr(db, 'get_sqlPassword') else None
+
+    # psycopg2 leaves out the arguments that are None
+    return psycopg2.connect(host = db.get_sqlServer(), dbname = db.get_sqlDatabase(),
+        user = user, password = password)
+
+# end newConnection() -------------------------------
+
+# Purpose: run a list of queries on a connection
+# Returns: list of result rows as dictionaries, keyed by column name
+# Assumes: Nothing
+# Effects: queries a database
+#
+def runOn(connection, cmds):
+
+    rows = []
+    cursor = connection.cursor()
+    for cmd in cmds:
+        countDbCall()
+        cursor.execute(cmd)
+        columns = [d[0] for d in cursor.description]
+        rows.extend([dict(zip(columns, r)) for r in cursor.fetchall()])
+    cursor.close()
+
+    return rows
+
+# end runOn() -------------------------------
+
+# Purpose: run independent lists of queries; in parallel, each on its
+#     own connection, up to queryConnections at a time
+# Returns: dictionary {name: list of result rows, ...}
+# Assumes: the queries only read
+# Effects: queries a database; runs the queries one after another
+#     through db.sql() if not parallel, or if extra connections cannot
+#     be opened (written to fpDiag)
+#
+def runQueries(
+    jobs,		# dictionary {name: [query, ...], ...}
+    parallel = 1	# 0 to run the queries one after another; opening
+			# connections costs more than small queries save
+    ):
+
+    results = {}
+
+    connections = []
+    if parallel and queryConnections > 1 and len(jobs) > 1:
+        try:
+            for i in range(min(queryConnections, len(jobs))):
+                connections.append(newConnection())
+        except Exception as e:
+            for connection in connections:
+                connection.close()
+            connections = []
+            fpDiag.write('Lookup queries run serially, cannot open %s connections: %s\n' % \
+                (min(queryConnections, len(jobs)), str(e).strip()))
+
+    if not connections:
+        for name in jobs:
+            results[name] = []
+            for cmd in jobs[name]:
+                results[name].extend(db.sql(cmd, 'auto'))
+        return results
+
+    # psycopg2 serializes the queries of jobs sharing a connection
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers = len(connections)) as executor:
+            futures = {}
+            for (i, name) in enumerate(jobs):
+                futures[name] = executor.submit(runOn, connections[i % len(connections)], jobs[name])
+            for name in jobs:
+                results[name] = futures[name].result()
+    finally:
+        for connection in connections:
+            connection.close()
+
+    return results
+
+# end runQueries() -------------------------------
+
+# Purpose: stream lines into a table with COPY FROM STDIN on the
+#     shared connection, 'batchRows' lines per COPY
+# Returns: number of rows copied
+# Assumes: lines are formatted for 'copyCmd'
+# Effects: inserts into the database; does not commit
+#
+def copyIn(
+    copyCmd,		# COPY ... FROM STDIN statement (str.)
+    lines,		# iterable of lines, each ending in a newline
+    batchRows,		# lines per COPY (integer)
+    fpLog = None	# file to report each batch to
+    ):
+
+    cursor = getConnection().cursor()
+    rowCount = 0
+    batch = []
+
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batchRows:
+            rowCount += copyBatch(cursor, copyCmd, batch, fpLog)
+            batch = []
+
+    if batch:
+        rowCount += copyBatch(cursor, copyCmd, batch, fpLog)
+
+    cursor.close()
+
+    return rowCount
+
+# end copyIn() -------------------------------
+
+# Purpose: run one COPY FROM STDIN for a batch of lines
+# Returns: number of rows copied
+# Assumes: Nothing
+# Effects: inserts into the database
+#
+def copyBatch(cursor, copyCmd, batch, fpLog):
+
+    cursor.copy_expert(copyCmd, io.StringIO(''.join(batch)))
+
+    # rowcount is -1 if the driver does not report it for COPY
+    rowCount = cursor.rowcount
+    if rowCount < 0:
+        rowCount = len(batch)
+
+    countDbCall()
+
+    if fpLog:
+        fpLog.write('COPY batch: %s rows\n' % rowCount)
+
+    return rowCount
+
+# end copyBatch() -------------------------------
+
+# Purpose: decide whether to query only the values referenced by the input
+#     or to load the whole lookup table
+# Returns: 1 if only the input values should be queried, else 0
+# Assumes: Nothing
+# Effects: Nothing
+#
+def isScoped(
+    valueCount,		# number of distinct values in the input (integer)
+    tableCount		# (estimated) number of rows in the lookup (integer)
+    ):
+
+    if tableCount is None or tableCount <= 0:
+        return 1
+
+    if valueCount > tableCount * scopeFraction:
+        return 0
+
+    return 1
+
+# end isScoped() -------------------------------
+
+#
+# LookupSnapshot
+#
+class LookupSnapshot:
+    # Is: an on-disk snapshot of the lookups shared by the QC and the load
+    #	marker:    QTL MGI ID -> (_Marker_key, symbol) for official QTLs
+    #	term:      interaction term -> _Term_key
+    #	reference: JNum -> _Refs_key
+    # Has: per lookup kind: the freshness probe the rows were read under,
+    #	the resolved rows, the values known not to resolve, and whether
+    #	the whole table has been loaded
+    # Does: resolves a set of values from the snapshot, querying the
+    #	database only for values it has not seen or when a freshness
+    #	probe shows the underlying table has changed; saves itself so
+    #	the next run (QC, load, curator re-run) can reuse it
+
+    # Purpose: constructor
+    # Returns: nothing
+    #
+    def __init__(self,
+        fileName	# snapshot file; None or '' to not persist (str.)
+        ):
+
+        self.fileName = fileName
+        self.kinds = {}
+        self.probes = {}
+        self.changed = 0
+
+    # Purpose: run the freshness probe and read the snapshot file,
+    #     discarding any kind whose probe no longer matches
+    # Returns: nothing
+    # Effects: queries a database, reads the snapshot file
+    #
+    def open(self):
+
+        for r in db.sql(probeCmd, 'auto'):
+            self.probes[r['kind']] = (r['rowCount'], str(r['modDate']))
+
+        snapshot = None
+        if self.fileName and os.path.exists(self.fileName):
+            try:
+                with open(self.fileName, 'rb') as fp:
+                    snapshot = pickle.load(fp)
+            except:
+                snapshot = None
+
+        if snapshot is None \
+                or snapshot.get('version') != snapshotVersion \
+                or snapshot.get('server') != db.get_sqlServer() \
+                or snapshot.get('database') != db.get_sqlDatabase():
+            snapshot = {'kinds': {}}
+
+        for kind in lookupQueries:
+            entry = snapshot['kinds'].get(kind)
+            if entry is None or entry['probe'] != self.probes.get(kind):
+                entry = {'probe': self.probes.get(kind), 'complete': 0,
+                    'rows': {}, 'missing': set()}
+                self.changed = 1
+            self.kinds[kind] = entry
+
+        return 0
+
+    # Purpose: a copy of the snapshot to refresh and load; the kinds are
+    #     shared until refresh() replaces them, so refreshing and loading
+    #     the copy leaves this snapshot unchanged
+    # Returns: LookupSnapshot
+    #
+    def copy(self):
+
+        snapshot = LookupSnapshot(self.fileName)
+        snapshot.kinds = dict(self.kinds)
+        snapshot.probes = dict(self.probes)
+
+        return snapshot
+
+    # Purpose: re-run the freshness probe and empty the kinds whose
+    #     tables changed since the snapshot was read
+    # Returns: 1 if any kind was emptied, else 0
+    # Assumes: open() has been called
+    # Effects: queries a database
+    #
+    def refresh(self):
+
+        probes = {}
+        for r in db.sql(probeCmd, 'auto'):
+            probes[r['kind']] = (r['rowCount'], str(r['modDate']))
+
+        emptied = 0
+        for kind in lookupQueries:
+            if self.kinds[kind]['probe'] != probes.get(kind):
+                self.kinds[kind] = {'probe': probes.get(kind), 'complete': 0,
+                    'rows': {}, 'missing': set()}
+                self.changed = 1
+                emptied = 1
+
+        self.probes = probes
+
+        return emptied
+
+    # Purpose: load every lookup kind not yet complete in full, so that
+    #     resolving needs no further queries
+    # Returns: nothing
+    # Assumes: open() has been called
+    # Effects: queries a database (concurrently, see runQueries)
+    #
+    def loadAll(self):
+
+        jobs = {}
+        for kind in lookupQueries:
+            if not self.kinds[kind]['complete']:
+                jobs[kind] = [lookupQueries[kind][0]]
+
+        results = runQueries(jobs)
+        for kind in jobs:
+            self.store(kind, 0, set(), results[kind])
+
+        return 0
+
+    # Purpose: resolve the values of several lookup kinds; the kinds
+    #     that need the database are queried concurrently (runQueries)
+    #     if more than one of them loads its whole table
+    # Returns: dictionary {kind: Lookup, ...}
+    # Assumes: open() has been called
+    # Effects: may query a database
+    #
+    def resolveAll(self,
+        requests	# dictionary {kind: collection of values, ...}
+        ):
+
+        requests = dict([(kind, set(requests[kind])) for kind in requests])
+
+        jobs = {}
+        for kind in requests:
+            entry = self.kinds[kind]
+            if not entry['complete']:
+                unknown = requests[kind] - entry['rows'].keys() - entry['missing']
+                if unknown:
+                    jobs[kind] = self.fetchCommands(kind, unknown)
+
+        fullLoads = len([kind for kind in jobs if not jobs[kind][0]])
+        results = runQueries(dict([(kind, jobs[kind][1]) for kind in jobs]), fullLoads > 1)
+        for kind in jobs:
+            self.store(kind, jobs[kind][0], jobs[kind][2], results[kind])
+
+        lookups = {}
+        for kind in requests:
+            rows = self.kinds[kind]['rows']
+            lookups[kind] = Lookup([(v, rows[v]) for v in requests[kind] if v in rows])
+
+        return lookups
+
+    # Purpose: build the queries for values not in the snapshot; the
+    #     whole table is loaded if the values are a large fraction of it
+    # Returns: (1 if only the values are queried else 0, [query, ...], values)
+    # Effects: Nothing
+    #
+    def fetchCommands(self, kind, values):
+
+        entry = self.kinds[kind]
+        fullCmd, column, keyColumn, valueColumns = lookupQueries[kind]
+
+        if isScoped(len(values), entry['probe'][0] if entry['probe'] else None):
+            cmd = fullCmd + 'and %s in (%%s) ' % column
+            values = sorted(values)
+            return (1, [cmd % sqlInList(values[i:i + batchSize])
+                for i in range(0, len(values), batchSize)], set(values))
+
+        return (0, [fullCmd], set(values))
+
+    # Purpose: add query results to the snapshot
+    # Returns: nothing
+    # Effects: changes the snapshot
+    #
+    def store(self, kind, scoped, values, results):
+
+        entry = self.kinds[kind]
+        fullCmd, column, keyColumn, valueColumns = lookupQueries[kind]
+
+        if scoped:
+            entry['missing'] |= values
+        else:
+            entry['rows'] = {}
+            entry['missing'] = set()
+            entry['complete'] = 1
+
+        for r in results:
+            if len(valueColumns) == 1:
+                entry['rows'][r[keyColumn]] = r[valueColumns[0]]
+            else:
+                entry['rows'][r[keyColumn]] = tuple([r[c] for c in valueColumns])
+
+        entry['missing'] -= entry['rows'].keys()
+        self.changed = 1
+
+        return 0
+
+    # Purpose: write the snapshot file if anything was resolved
+    #     from the database
+    # Returns: nothing
+    # Effects: writes the snapshot file; a snapshot that cannot be
+    #     written is not an error, the next run queries the database
+    #
+    def save(self):
+
+        if not self.fileName or not self.changed:
+            return 0
+
+        snapshot = {'version': snapshotVersion,
+            'server': db.get_sqlServer(),
+            'database': db.get_sqlDatabase(),
+            'kinds': self.kinds}
+
+        tmpFileName = '%s.%s' % (self.fileName, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.fileName)), exist_ok=True)
+            with open(tmpFileName, 'wb') as fp:
+                pickle.dump(snapshot, fp, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpFileName, self.fileName)
+        except:
+            try:
+                os.remove(tmpFileName)
+            except:
+                pass
+
+        self.changed = 0
+
+        return 0
+
+# end class LookupSnapshot -------------------------------
+
+#
+# QcCache
+#
+class QcCache:
+    # Is: an on-disk cache of the per-line lookup check results of the QC
+    # Has: the freshness probes of the lookup snapshot the results were
+    #	computed under, and per line digest the errors found
+    #	[(check, value, compared), ...] - an empty list for a valid line
+    # Does: gives the cached result of an unchanged line, so a QC re-run
+    #	after a small edit only checks the new or changed lines; the
+    #	whole cache is dropped when a probe shows a lookup table changed
+
+    # Purpose: constructor
+    # Returns: nothing
+    #
+    def __init__(self,
+        fileName,	# cache file; None or '' to not persist (str.)
+        probes		# LookupSnapshot.probes the results are valid for
+        ):
+
+        self.fileName = fileName
+        self.probes = probes
+        self.lines = {}
+        self.seen = {}
+
+    # Purpose: read the cache file, unless it was written under other
+    #     lookup probes or by another version
+    # Returns: nothing
+    # Effects: reads the cache file
+    #
+    def open(self):
+
+        if not self.fileName or not os.path.exists(self.fileName):
+            return 0
+
+        try:
+            with open(self.fileName, 'rb') as fp:
+                cache = pickle.load(fp)
+        except:
+            return 0
+
+        if cache.get('version') == snapshotVersion \
+                and cache.get('server') == db.get_sqlServer() \
+                and cache.get('database') == db.get_sqlDatabase() \
+                and cache.get('probes') == self.probes:
+            self.lines = cache['lines']
+
+        return 0
+
+    # Purpose: get the cached result of a line
+    # Returns: list of errors, None if the line is not cached
+    #
+    def get(self, digest):
+
+        errors = self.lines.get(digest)
+        if errors is not None:
+            self.seen[digest] = errors
+
+        return errors
+
+    # Purpose: record the result of a line; nothing is kept if the
+    #     cache is not persisted
+    # Returns: nothing
+    #
+    def put(self, digest, errors):
+
+        if self.fileName:
+            self.seen[digest] = errors
+
+    # Purpose: keep the cached results of the lines of this run
+    # Returns: nothing
+    #
+    def keep(self, digests):
+
+        lines = self.lines
+        if lines:
+            self.seen.update([(digest, lines[digest]) for digest in digests if digest in lines])
+
+    # Purpose: record lines without a recorded result as valid
+    # Returns: nothing
+    #
+    def putValid(self, digests):
+
+        for digest in digests:
+            self.seen.setdefault(digest, [])
+
+    # Purpose: write the results of the lines of this run; lines no longer
+    #     in the file are dropped
+    # Returns: nothing
+    # Effects: writes the cache file; a cache that cannot be written is
+    #     not an error, the next run checks every line
+    #
+    def save(self):
+
+        if not self.fileName:
+            return 0
+
+        cache = {'version': snapshotVersion,
+            'server': db.get_sqlServer(),
+            'database': db.get_sqlDatabase(),
+            'probes': self.probes,
+            'lines': self.seen}
+
+        tmpFileName = '%s.%s' % (self.fileName, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.fileName)), exist_ok=True)
+            with open(tmpFileName, 'wb') as fp:
+                pickle.dump(cache, fp, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpFileName, self.fileName)
+        except:
+            try:
+                os.remove(tmpFileName)
+            except:
+                pass
+
+        return 0
+
+# end class QcCache -------------------------------
+
+#
+# KeyBlock
+#
+class KeyBlock:
+    # Is: a block of primary keys reserved from a sequence
+    # Has: the reserved keys in ascending order, the first and last key
+    # Does: reserves exactly the number of keys needed with one
+    #	multi-row nextval; the keys are unique even when other loads
+    #	draw from the sequence at the same time (they are contiguous
+    #	unless another session interleaves), and the sequence is
+    #	already past them so no setval is needed after the load;
+    #	reserves nothing when there are no keys to reserve, and numbers
+    #	the rows 1..count without touching the sequence when not
+    #	reserving (debug runs that load nothing)
+
+    # Purpose: constructor; reserves the keys
+    # Returns: nothing
+    # Effects: queries a database, advances the sequence if reserve
+    #	and count > 0
+    #
+    def __init__(self,
+        sequence,	# sequence name (str.)
+        count,		# number of keys to reserve (integer)
+        reserve = 1	# 0 to number the rows without reserving keys
+        ):
+
+        self.sequence = sequence
+        self.reserved = reserve
+        self.keys = []
+
+        if count > 0 and not reserve:
+            self.keys = list(range(1, count + 1))
+        elif count > 0:
+            results = db.sql('''select nextval('%s') as nextKey
+                from generate_series(1, %s) ''' % (sequence, count), 'auto')
+            self.keys = sorted([r['nextKey'] for r in results])
+
+        if self.keys:
+            self.first = self.keys[0]
+            self.last = self.keys[-1]
+        else:
+            self.first = None
+            self.last = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __str__(self):
+        if not self.reserved:
+            return '%s keys not reserved from %s (debug)' % (len(self.keys), self.sequence)
+        return '%s keys %s-%s from %s' % (len(self.keys), self.first, self.last, self.sequence)
+
+# end class KeyBlock -------------------------------
+
+#
+# QcSection
+#
+class QcSection:
+    # Is: one error category of the QC report
+    # Has: title, column headings, whether the errors are fatal,
+    #	the formatted lines of the category
+    #	spooled to a temporary file (kept in memory up to spoolSize),
+    #	and the number of lines
+    # Does: adds lines as errors are found so memory does not grow with
+    #	the number of errors; writes the section with its heading and
+    #	total to the report
+
+    # Purpose: constructor
+    # Returns: nothing
+    #
+    def __init__(self,
+        name,				# check name in the structured output (str.)
+        title,				# section title (str.)
+        columns = ['Line#', 'Line'],	# column headings
+        fields = ['lineNum', 'line'],	# entry fields written for each line
+        separator = '',			# written between lines (str.)
+        fieldSeparator = '  ',		# written between fields (str.)
+        fatal = 1,			# 1 if the errors stop the load
+        widths = None			# widths of the columns before the
+					# last; None for 12-wide headings and
+					# unpadded entries
+        ):
+
+        self.name = name
+        self.title = title
+        self.columns = columns
+        self.fields = fields
+        self.widths = widths
+        self.separator = separator
+        self.fieldSeparator = fieldSeparator
+        self.fatal = fatal
+        self.count = 0
+        self.spool = tempfile.SpooledTemporaryFile(max_size = spoolSize,
+            mode = 'w+', encoding = 'utf-8', errors = 'replace')
+
+    def __len__(self):
+        return self.count
+
+    # Purpose: add an error entry to the section
+    # Returns: nothing
+    #
+    def add(self,
+        entry		# dictionary with at least the section's fields
+        ):
+
+        values = [str(entry[f]) for f in self.fields]
+        if self.widths:
+            values[:-1] = ['%-*s' % (w, v) for (w, v) in zip(self.widths, values[:-1])]
+
+        self.append(self.fieldSeparator.join(values))
+
+    # Purpose: add a formatted line to the section
+    # Returns: nothing
+    #
+    def append(self, text):
+
+        if self.count > 0:
+            self.spool.write(self.separator)
+        self.spool.write(text)
+        self.count += 1
+
+    # Purpose: write the section, if it has any lines, to the report
+    # Returns: nothing
+    # Effects: writes to 'fp'
+    #
+    def writeTo(self, fp):
+
+        if not self.count:
+            return 0
+
+        widths = self.widths or [12] * (len(self.columns) - 1)
+
+        fp.write('\n\n' + str.center(self.title, 60) + '\n')
+        fp.write('  '.join(['%-*s' % (w, c) for (w, c) in zip(widths, self.columns[:-1])] + ['%-20s' % self.columns[-1]]) + '\n')
+        fp.write('  '.join([w*'-' for w in widths] + [20*'-']) + '\n')
+        self.spool.seek(0)
+        shutil.copyfileobj(self.spool, fp)
+        self.spool.seek(0, 2)
+        fp.write('\n' + 'Total: %s' % self.count)
+
+        return 0
+
+    def close(self):
+        self.spool.close()
+
+# end class QcSection -------------------------------
+
+# snapshots opened by this process {fileName: Future of LookupSnapshot, ...}
+openSnapshots = {}
+
+# Purpose: open a LookupSnapshot
+# Returns: LookupSnapshot
+# Effects: see LookupSnapshot.open()
+#
+def newSnapshot(fileName):
+
+    snapshot = LookupSnapshot(fileName)
+    snapshot.open()
+
+    return snapshot
+
+# end newSnapshot() -------------------------------
+
+# Purpose: start opening the lookup snapshot (freshness probe and
+#     snapshot file) in the background, so it overlaps input parsing
+# Returns: nothing
+# Assumes: the caller makes no db.sql() calls until openSnapshot()
+# Effects: see LookupSnapshot.open()
+#
+def prefetchSnapshot(
+    fileName		# snapshot file; None or '' to not persist (str.)
+    ):
+
+    if fileName not in openSnapshots:
+        # the thread ends once the snapshot is open
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+        openSnapshots[fileName] = executor.submit(newSnapshot, fileName)
+        executor.shutdown(wait = False)
+
+    return 0
+
+# end prefetchSnapshot() -------------------------------
+
+# Purpose: open the lookup snapshot once per process, so the QC and the
+#     load run in one process share the resolved lookups
+# Returns: LookupSnapshot
+# Effects: see LookupSnapshot.open()
+#
+def openSnapshot(
+    fileName		# snapshot file; None or '' to not persist (str.)
+    ):
+
+    prefetchSnapshot(fileName)
+
+    return openSnapshots[fileName].result()
+
+# end openSnapshot() -------------------------------
+
+# Purpose: load every lookup kind of the snapshot in full, on a
+#     connection opened and closed here, and make it the snapshot of
+#     this process - for a process that forks children which must not
+#     use the database. Given the snapshot now in use, only the kinds
+#     whose tables changed are reloaded, into a copy; the snapshot in
+#     use is left unchanged if the load fails.
+# Returns: the loaded LookupSnapshot
+# Assumes: the shared connection is not in use
+# Effects: queries a database, writes the snapshot file, sets the
+#     snapshot openSnapshot() returns
+# Throws: database errors
+#
+def preloadSnapshot(
+    fileName,		# snapshot file; None or '' to not persist (str.)
+    current = None	# LookupSnapshot to refresh; None to open one
+    ):
+
+    db.useOneConnection(1)
+
+    try:
+        if current is None:
+            snapshot = newSnapshot(fileName)
+        else:
+            snapshot = current.copy()
+            snapshot.refresh()
+
+        snapshot.loadAll()
+        snapshot.save()
+    finally:
+        # the children must not share the connection
+        db.useOneConnection(0)
+
+    future = concurrent.futures.Future()
+    future.set_result(snapshot)
+    openSnapshots[fileName] = future
+
+    return snapshot
+
+# end preloadSnapshot() -------------------------------
+
+# Purpose: wait until the snapshots opening in the background are open,
+#     so the shared connection can be closed
+# Returns: nothing
+# Assumes: Nothing
+# Effects: waits for the prefetch threads; their errors are not raised
+#
+def waitSnapshots():
+
+    concurrent.futures.wait(list(openSnapshots.values()))
+
+# end waitSnapshots() -------------------------------
+
+# database round trips made by this process (db.sql calls and COPY batches)
+dbCallCount = 0
+
+# the db.sql being counted; None until countDbCalls() is called
+dbSql = None
+
+# Purpose: count a database round trip
+# Returns: nothing
+# Assumes: Nothing
+# Effects: increments dbCallCount
+#
+def countDbCall():
+    global dbCallCount
+
+    dbCallCount += 1
+
+# end countDbCall() -------------------------------
+
+# Purpose: wrap db.sql so that each call is counted in dbCallCount
+# Returns: nothing
+# Assumes: the scripts call db.sql() through the db module
+# Effects: replaces db.sql, once per process
+#
+def countDbCalls():
+    global dbSql
+
+    if dbSql is not None:
+        return 0
+
+    dbSql = db.sql
+
+    def sql(*args, **kwargs):
+        countDbCall()
+        return dbSql(*args, **kwargs)
+
+    db.sql = sql
+
+    return 0
+
+# end countDbCalls() -------------------------------
+
+#
+# PhaseMetrics
+#
+class PhaseMetrics:
+    # Is: the phase timings of one run of a script
+    # Has: the phases in the order they started, each with wall and
+    #	CPU seconds, rows processed, database round trips and the
+    #	peak RSS (KB) at the end of the phase
+    # Does: times (nested) phases, writes them to a log and appends
+    #	them as a JSON line to ${LOGDIR}/<script>.metrics
+
+    def __init__(self,
+        script		# script name, used for the metrics file (str.)
+        ):
+
+        self.script = script
+        self.phases = []
+        self.running = []
+        countDbCalls()
+
+    def start(self, name):
+        phase = {'phase' : name, 'depth' : len(self.running),
+            'wall' : time.time(), 'cpu' : time.process_time(),
+            'rows' : None, 'dbCalls' : dbCallCount, 'peakRssKb' : None}
+        self.phases.append(phase)
+        self.running.append(phase)
+
+        return phase
+
+    def stop(self, rows = None):
+        phase = self.running.pop()
+        phase['wall'] = time.time() - phase['wall']
+        phase['cpu'] = time.process_time() - phase['cpu']
+        phase['rows'] = rows
+        phase['dbCalls'] = dbCallCount - phase['dbCalls']
+        phase['peakRssKb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        return phase
+
+    def timings(self):
+        # {phase: wall seconds, ...} of the finished phases
+        return dict([(p['phase'], p['wall']) for p in self.phases if p not in self.running])
+
+    def write(self, fp):
+        fp.write('\n%-28s %10s %10s %10s %8s %12s\n' % \
+            ('Phase', 'Wall(s)', 'CPU(s)', 'Rows', 'DbCalls', 'PeakRSS(KB)'))
+        for p in self.phases:
+            if p in self.running:
+                continue
+            fp.write('%-28s %10.3f %10.3f %10s %8s %12s\n' % \
+                ('  ' * p['depth'] + p['phase'], p['wall'], p['cpu'],
+                '' if p['rows'] is None else p['rows'], p['dbCalls'], p['peakRssKb']))
+
+        return 0
+
+    def save(self):
+        # metrics are only kept when there is a log directory;
+        # a failed write does not fail the run
+        logDir = os.getenv('LOGDIR')
+        if not logDir:
+            return 0
+
+        try:
+            with open(os.path.join(logDir, self.script + '.metrics'), 'a') as fp:
+                fp.write(json.dumps({'script' : self.script,
+                    'date' : time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'phases' : [p for p in self.phases if p not in self.running]}) + '\n')
+        except (IOError, OSError):
+            pass
+
+        return 0
+
+# end class PhaseMetrics -------------------------------
+
+# the cProfile.Profile of this run and the name of its output;
+# None unless PROFILE_RUN=true
+profiler = None
+profileName = None
+
+# Purpose: profile the rest of the run with cProfile if PROFILE_RUN=true
+# Returns: nothing
+# Assumes: Nothing
+# Effects: enables the profiler, once per process
+#
+def startProfile(
+    name		# script name, used for the profile file (str.)
+    ):
+    global profiler, profileName
+
+    if profiler is not None or os.getenv('PROFILE_RUN') != 'true':
+        return 0
+
+    profileName = name
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    return 0
+
+# end startProfile() -------------------------------
+
+# Purpose: stop the profiler and save the stats to ${LOGDIR}/<name>.prof
+#     (read with python -m pstats)
+# Returns: nothing
+# Assumes: Nothing
+# Effects: writes the profile file
+#
+def saveProfile():
+    global profiler
+
+    if profiler is None:
+        return 0
+
+    profiler.disable()
+    try:
+        profiler.dump_stats(os.path.join(os.getenv('LOGDIR', '.'), profileName + '.prof'))
+    except (IOError, OSError):
+        pass
+    profiler = None
+
+    return 0
+
+# end saveProfile() -------------------------------
@@ -9,9 +9,16 @@
 #
 #  Usage:
 #
-#      qtlIntQC.py  filename
+#      qtlIntQC.py  [--fail-fast] [--max-errors N] [--workers N]  filename
 #
 #      where:
+#          --fail-fast = stop at the first fatal error found
+#          --max-errors N = stop after N fatal errors (${QC_MAX_ERRORS});
+#		0 = no limit
+#	   The checks run in stages - line structure over the whole file,
+#	   then the lookups, then the reciprocals - so the errors found
+#	   first are those of the earliest stage, not of the earliest lines
+#          --workers N = run the lookup checks in N processes (${QC_WORKERS})
 #          filename = path to the input file
 #
 #  Inputs:
@@ -20,6 +27,14 @@
 #  Outputs:
 #
 #      - QC report (${QC_RPT})
+#      - phase timings on stdout and in ${LOGDIR}/qtlIntQC.metrics;
+#	 with PROFILE_RUN=true a cProfile in ${LOGDIR}/qtlIntQC.prof
+#      - structured QC results (${QC_JSON}), if set: one JSON line per
+#	 error {check, lineNum, line, columns, value, compared} followed
+#	 by a {summary} line with per-check counts and per-phase timings;
+#	 columns are the first six columns of the line
+#      - per-line lookup check results (${QC_CACHE}), reused by the next
+#	 run for the lines that did not change
 #
 #  Exit Codes:
 #
@@ -51,7 +66,14 @@ import os
 import string
 import db
 import time
+import hashlib
+import json
+import getopt
+import multiprocessing
+import heapq
+import operator
 import Set
+import qtlIntLib
 
 #
 #  CONSTANTS
@@ -59,7 +81,7 @@ import Set
 TAB = '\t'
 CRT = '\n'
 
-USAGE = 'Usage: qtlIntQC.py  inputFile'
+USAGE = 'Usage: qtlIntQC.py  [--fail-fast] [--max-errors N] [--workers N]  inputFile'
 
 #
 #  GLOBALS
@@ -75,38 +97,100 @@ inputFile = None
 # QC report file
 qcRptFile = os.getenv('QC_RPT')
 
-# lines seen in the input file
-distinctLineList = []
+# structured QC results (JSON lines), optional
+qcJsonFile = os.getenv('QC_JSON')
+fpQcJson = None
+
+# phase timings, written to the log and ${LOGDIR}/qtlIntQC.metrics
+metrics = qtlIntLib.PhaseMetrics('qtlIntQC')
+
+# lookup snapshot shared with the load
+lookupCacheFile = os.getenv('LOOKUP_CACHE')
+
+# lines of the input file as read, without the header; the checks
+# refer to lines by their index in this list; released once the lines
+# are parsed, as each InputRow keeps its line
+inputLines = []
+
+# parsed input lines [qtlIntLib.InputRow, ...], by index in inputLines;
+# only parsed here when the checks run in this process - worker
+# processes parse their own chunks (see parseInput, recordAt)
+inputRecords = []
+
+# number of input lines, without the header
+lineCount = 0
+
+# digest of each input line, by index in inputLines
+lineDigestList = []
+
+# per-line lookup check results of earlier runs
+qcCacheFile = os.getenv('QC_CACHE')
+qcCache = None
+
+# distinct (QTL IDs, interaction terms, JNums) of the lines not in the
+# QC cache, collected by the structural checks
+lookupValues = (set(), set(), set())
+
+# indexes in inputLines of the lines the lookup checks must run on:
+# the lines not in the QC cache
+pendingList = []
+
+# lookup check results of the lines in the QC cache that have errors
+# [(line index, [(section name, value, compared), ...]), ...]
+cachedErrorList = []
+
+# digests of the normalized lines seen in the input file
+# {digest: line number of first occurrence, ...}
+distinctLineDict = {}
+
+#
+# QC report sections, in report order; each section spools its lines
+# to a temporary file as they are found
+#
 
 # duplicated lines in the input
-dupeLineList = []
+dupeLineSection = qtlIntLib.QcSection('dupeLine', 'Lines Duplicated In Input',
+    ['Line#', 'First Line#', 'Line'], ['lineNum', 'compared', 'line'], fatal = 0, widths = [12, 12])
 
 # lines with < 6 columns
-missingColumnList = []
+missingColumnSection = qtlIntLib.QcSection('missingColumn', 'Lines with < 6 Columns', separator = CRT)
 
 # lines with missing data in columns
-reqColumnList = []
-
-# a QTL id is not found in the database
-badQtlIdList = []
+reqColumnSection = qtlIntLib.QcSection('reqColumn', 'Missing Data in Required Columns')
 
 # org and part are same ID
-orgPartSameList = []
+orgPartSameSection = qtlIntLib.QcSection('orgPartSame', 'Organizer and Participant have same ID')
+
+# a QTL id is not found in the database
+badQtlIdSection = qtlIntLib.QcSection('badQtlId', 'Invalid Organizer and/or Participant ID')
 
 # a QTL id does not match symbol in the database
-idSymDiscrepList = []
+idSymDiscrepSection = qtlIntLib.QcSection('idSymDiscrep', 'Organizer and/or Participant ID does not match Symbol')
 
 # interactions not valid
-badIntTermList = []
+badIntTermSection = qtlIntLib.QcSection('badIntTerm', 'Interaction Term does not Resolve')
+
+# Jnum not in database
+badJnumSection = qtlIntLib.QcSection('badJnum', 'JNumber value is not in the Database')
 
 # no reciprocal for  org/part
-noReciprocalList = []
+noReciprocalSection = qtlIntLib.QcSection('noReciprocal', 'No Reciprocal for Organizer/Participant',
+    ['Line#', 'Missing Reciprocal', 'Line'], ['lineNum', 'compared', 'line'], widths = [12, 24])
 
-# Jnum not in database
-badJnumList = []
+reportSections = [dupeLineSection, missingColumnSection, reqColumnSection,
+    orgPartSameSection, badQtlIdSection, idSymDiscrepSection, badIntTermSection,
+    badJnumSection, noReciprocalSection]
+
+# section name -> section
+sectionDict = {}
+for section in reportSections:
+    sectionDict[section.name] = section
 
 # to determine that the reciprocal is in the input file
-qtlPairDict = {}
+# (organizer key, participant key) of each line, by index in inputLines;
+# None for a line with < 6 columns
+# the keys are the numeric part of the MGI IDs - see qtlIntLib.idKey()
+qtlPairList = []
 
 # lines that pass QC
 #goodLineList = []
@@ -114,14 +198,30 @@ qtlPairDict = {}
 # 1 if any QC errors in the input file
 hasFatalErrors = 0
 
+# stop after this many fatal errors (--max-errors N, --fail-fast = 1);
+# 0 checks the whole file
+maxErrors = int(os.getenv('QC_MAX_ERRORS', '0'))
+
+# number of processes for the lookup checks (--workers N); 1 = serial
+qcWorkers = int(os.getenv('QC_WORKERS', '1'))
+
+# input lines per worker chunk
+qcChunkSize = int(os.getenv('QC_CHUNK_SIZE', '5000'))
+
+# number of fatal errors found
+fatalErrorCount = 0
+
+# 1 if QC stopped at maxErrors and the report is incomplete
+cutShort = 0
+
 # lookup of QTL MGI IDs {qtlID: qtlSymbol, ...}
-qtlLookupDict = {}
+qtlLookup = qtlIntLib.Lookup()
 
-# list if QTL Interactions vocabulary terms 
-interactionLookupList = []
+# lookup of QTL Interactions vocabulary terms
+interactionLookup = qtlIntLib.Lookup()
 
 # reference ID (JNum) lookup 
-jNumLookupList = []
+jNumLookup = qtlIntLib.Lookup()
 
 # Purpose: Validate the arguments to the script.
 # Returns: Nothing
@@ -130,18 +230,43 @@ jNumLookupList = []
 # Throws: Nothing
 #
 def checkArgs ():
-    global inputFile
+    global inputFile, maxErrors, qcWorkers
 
-    if len(sys.argv) != 2:
+    try:
+        optList, args = getopt.getopt(sys.argv[1:], '', ['fail-fast', 'max-errors=', 'workers='])
+    except getopt.GetoptError:
         print(USAGE)
         sys.exit(1)
 
-    inputFile = sys.argv[1]
+    if len(args) != 1:
+        print(USAGE)
+        sys.exit(1)
+
+    for (opt, value) in optList:
+        if opt == '--fail-fast':
+            maxErrors = 1
+        elif opt == '--max-errors':
+            try:
+                maxErrors = int(value)
+            except ValueError:
+                print(USAGE)
+                sys.exit(1)
+            if maxErrors < 0:
+                print(USAGE)
+                sys.exit(1)
+        elif opt == '--workers':
+            try:
+                qcWorkers = int(value)
+            except ValueError:
+                print(USAGE)
+                sys.exit(1)
+
+    inputFile = args[0]
     return 0
 
 # end checkArgs() -------------------------------
 
-# Purpose: create lookups, open files
+# Purpose: open files, read the input
 # Returns: Nothing
 # Assumes: Nothing
 # Effects: Sets global variables, exits if a file can't be opened,
@@ -153,55 +278,109 @@ def init ():
     openFiles()
     db.useOneConnection(1)
 
-    #
-    # create lookups
-    #
+    # the freshness probe and the snapshot file are read while the
+    # input is read
+    qtlIntLib.prefetchSnapshot(lookupCacheFile)
 
-    loadLookups()
+    readInput()
+
+    # the lookups are loaded by runQcChecks() once the checks that
+    # do not need them have passed the error budget
 
     return 0
 
 # end init() -------------------------------
 
+# Purpose: read the input; the lines are parsed as they are read if
+#     the checks run in this process, else kept for the workers to parse
+# Returns: Nothing
+# Assumes: the input file is open
+# Effects: reads the input file, sets inputLines or inputRecords, and
+#     lineCount
+#
+
+def readInput():
+    global inputLines, inputRecords, lineCount
+
+    if qcWorkers <= 1:
+        inputRecords = qtlIntLib.readRecords(fpInput)
+        lineCount = len(inputRecords)
+    else:
+        inputLines = qtlIntLib.readLines(fpInput)
+        lineCount = len(inputLines)
+
+    return 0
+
+# end readInput() -------------------------------
+
+# Purpose: parse all input lines, e.g. for the load
+# Returns: Nothing
+# Assumes: readInput() has been run
+# Effects: sets inputRecords, releases inputLines
+#
+
+def parseInput():
+    global inputLines, inputRecords
+
+    if inputLines:
+        inputRecords = [qtlIntLib.parseLine(i + 2, line) for (i, line) in enumerate(inputLines)]
+        # keep one copy of each line, the InputRow's
+        inputLines = []
+
+    return 0
+
+# end parseInput() -------------------------------
+
+# Purpose: get a parsed input line
+# Returns: qtlIntLib.InputRow
+# Assumes: readInput() has been run
+# Effects: Nothing
+#
+
+def recordAt(
+    i		# index of the line in inputLines
+    ):
+
+    if inputRecords:
+        return inputRecords[i]
+
+    return qtlIntLib.parseLine(i + 2, inputLines[i])
+
+# end recordAt() -------------------------------
+
 # Purpose: load lookups for verification
+#     values are resolved through the lookup snapshot shared with the
+#     load; only values the snapshot has not seen are queried, and only
+#     those in the input unless the input references a large fraction
+#     of the table, in which case the whole table is loaded
 # Returns: Nothing
 # Assumes: 
-# Effects: queries a database, modifies global variables
+# Effects: queries a database, reads/writes the lookup snapshot,
+#     modifies global variables
 #
 
 def loadLookups(): 
-    global qtlLookupDict, interactionLookupList, jNumLookupList
-
-    results = db.sql('''select a.accid, m.symbol
-        from acc_accession a, mrk_marker m
-        where m._marker_type_key = 6 --qtl
-        and m._marker_status_key = 1 -- official
-        and m._marker_key = a._object_key
-        and a._mgitype_key = 2
-        and a._logicaldb_key = 1
-        and a.preferred = 1
-        and a.private = 0
-        and a.prefixPart = 'MGI:' ''', 'auto')
-
-    for r in results:
-        qtlLookupDict[r['accid']] = r['symbol']
-    
-    results = db.sql('''select term
-        from voc_term
-        where _vocab_key = 178 -- QTL Interactions ''', 'auto')
-
-    for  r in results:
-        interactionLookupList.append(r['term'])
-
-    results = db.sql('''select a.accid
-        from acc_accession a
-        where a._mgitype_key = 1
-        and a._logicaldb_key = 1
-        and a.preferred = 1
-        and a.private = 0
-        and a.prefixpart = 'J:' ''', 'auto')
-    for r in results:
-        jNumLookupList.append(r['accid'])
+    global qtlLookup, interactionLookup, jNumLookup
+
+    metrics.start('loadLookups')
+
+    qtlIDs, terms, jNums = lookupValues
+
+    snapshot = qtlIntLib.openSnapshot(lookupCacheFile)
+
+    # the kinds not in the snapshot are queried concurrently
+    lookups = snapshot.resolveAll({'marker' : qtlIDs, 'term' : terms, 'reference' : jNums})
+
+    results = lookups['marker']
+    qtlLookup = qtlIntLib.Lookup([(qtlID, results[qtlID][1]) for qtlID in results])
+
+    interactionLookup = lookups['term']
+
+    jNumLookup = lookups['reference']
+
+    snapshot.save()
+
+    metrics.stop(len(qtlLookup) + len(interactionLookup) + len(jNumLookup))
 
     return 0
 
@@ -216,16 +395,14 @@ def loadLookups():
 #
 def openFiles ():
     #global fpInput, fpLoadReady, fpQcRpt
-    global fpInput, fpQcRpt
+    global fpInput, fpQcRpt, fpQcJson
 
     #
-    # Open the input file
+    # Open the input file; it is normalized as it is read, see
+    # qtlIntLib.openInput()
     #
-    # encoding='utf-8' no
-    # encoding=u'utf-8' no
-
     try:
-        fpInput = open(inputFile, 'r', encoding='utf-8', errors='replace')
+        fpInput = qtlIntLib.openInput(inputFile)
     except:
         print('Cannot open input file: %s' % inputFile)
         sys.exit(1)
@@ -248,6 +425,16 @@ def openFiles ():
         print('Cannot open report file: %s' % qcRptFile)
         sys.exit(1)
 
+    #
+    # Open structured QC results file
+    #
+    if qcJsonFile:
+        try:
+            fpQcJson = open(qcJsonFile, 'w')
+        except:
+            print('Cannot open QC results file: %s' % qcJsonFile)
+            sys.exit(1)
+
     return 0
 
 # end openFiles() -------------------------------
@@ -269,69 +456,13 @@ def writeReport():
          return 0
     fpQcRpt.write('Fatal QC - if published the file will not be loaded')
 
-    if len(dupeLineList):
-        fpQcRpt.write(CRT + CRT + str.center('Lines Duplicated In Input',60) + CRT)
-        fpQcRpt.write('%-12s  %-20s%s' % ('Line#','Line', CRT))
-        fpQcRpt.write(12*'-' + '  ' + 20*'-' + CRT)
-        fpQcRpt.write(''.join(dupeLineList))
-        fpQcRpt.write(CRT + 'Total: %s' % len(dupeLineList))
-
-    if len(missingColumnList):
-        fpQcRpt.write(CRT + CRT + str.center('Lines with < 6 Columns',60) + CRT)
-        fpQcRpt.write('%-12s  %-20s%s' % ('Line#','Line', CRT))
-        fpQcRpt.write(12*'-' + '  ' + 20*'-' + CRT)
-        fpQcRpt.write(CRT.join(missingColumnList))
-        fpQcRpt.write(CRT + 'Total: %s' % len(missingColumnList))
-
-    if len(reqColumnList):
-        hasSkipErrors = 1
-        fpQcRpt.write(CRT + CRT + str.center('Missing Data in Required Columns',60) + CRT)
-        fpQcRpt.write('%-12s  %-20s%s' % ('Line#','Line', CRT))
-        fpQcRpt.write(12*'-' + '  ' + 20*'-' + CRT)
-        fpQcRpt.write(''.join(reqColumnList))
-        fpQcRpt.write(CRT + 'Total: %s' % len(reqColumnList))
-
-    if len(orgPartSameList):
-        fpQcRpt.write(CRT + CRT + str.center('Organizer and Participant have same ID',60) + CRT)
-        fpQcRpt.write('%-12s  %-20s%s' % ('Line#','Line', CRT))
-        fpQcRpt.write(12*'-' + '  ' + 20*'-' + CRT)
-        fpQcRpt.write(''.join(orgPartSameList))
-        fpQcRpt.write(CRT + 'Total: %s' % len(orgPartSameList))
-
-    if len(badQtlIdList):
-        fpQcRpt.write(CRT + CRT + str.center('Invalid Organizer and/or Participant ID',60) + CRT)
-        fpQcRpt.write('%-12s  %-20s%s' % ('Line#','Line', CRT))
-        fpQcRpt.write(12*'-' + '  ' + 20*'-' + CRT)
-        fpQcRpt.write(''.join(badQtlIdList))
-        fpQcRpt.write(CRT + 'Total: %s' % len(badQtlIdList))
-
-    if len(idSymDiscrepList):
-        fpQcRpt.write(CRT + CRT + str.center('Organizer and/or Participant ID does not match Symbol',60) + CRT)
-        fpQcRpt.write('%-12s  %-20s%s' % ('Line#','Line', CRT))
-        fpQcRpt.write(12*'-' + '  ' + 20*'-' + CRT)
-        fpQcRpt.write(''.join(idSymDiscrepList))
-        fpQcRpt.write(CRT + 'Total: %s' % len(idSymDiscrepList))
-
-    if len(badIntTermList):
-        fpQcRpt.write(CRT + CRT + str.center('Interaction Term does not Resolve',60) + CRT)
-        fpQcRpt.write('%-12s  %-20s%s' % ('Line#','Line', CRT))
-        fpQcRpt.write(12*'-' + '  ' + 20*'-' + CRT)
-        fpQcRpt.write(''.join(badIntTermList))
-        fpQcRpt.write(CRT + 'Total: %s' % len(badIntTermList))
-
-    if len(badJnumList):
-        fpQcRpt.write(CRT + CRT + str.center('JNumber value is not in the Database',60) + CRT)
-        fpQcRpt.write('%-12s  %-20s%s' % ('Line#','Line', CRT))
-        fpQcRpt.write(12*'-' + '  ' + 20*'-' + CRT)
-        fpQcRpt.write(''.join(badJnumList))
-        fpQcRpt.write(CRT + 'Total: %s' % len(badJnumList))
-
-    if len(noReciprocalList):
-        fpQcRpt.write(CRT + CRT + str.center('No Reciprocal for Organizer/Participant',60) + CRT)
-        fpQcRpt.write('%-12s  %-20s%s' % ('Line#', 'Line', CRT))
-        fpQcRpt.write(12*'-' + '  ' + 20*'-' + CRT)
-        fpQcRpt.write(''.join(noReciprocalList))
-        fpQcRpt.write(CRT + 'Total: %s' % len(noReciprocalList))
+    if cutShort:
+        fpQcRpt.write(CRT + 'QC stopped after %s fatal error(s) (--fail-fast/--max-errors) - this report is incomplete' % fatalErrorCount)
+        fpQcRpt.write(CRT + 'The line structure checks run over the whole file before the lookup and reciprocal checks, ' + \
+            'so these are the first errors found by check, not the errors of the first lines')
+
+    for section in reportSections:
+        section.writeTo(fpQcRpt)
 
     return 0
 
@@ -350,13 +481,509 @@ def closeFiles ():
     fpInput.close()
     #fpLoadReady.close()
     fpQcRpt.close()
+    if fpQcJson:
+        fpQcJson.close()
+
+    for section in reportSections:
+        section.close()
 
     return 0
 
 # end closeFiles) -------------------------------
 
+#
+# Purpose: record a QC error in its report section and, if requested,
+#     in the structured QC results
+# Returns: Nothing
+# Assumes: files have been opened
+# Effects: writes to the section spool and the QC_JSON file
+# Throws: Nothing
+#
+def addError(
+    section,		# qtlIntLib.QcSection
+    row,		# qtlIntLib.InputRow
+    value = None,	# the value that failed the check
+    compared = None	# the lookup/reference value it was compared against
+    ):
+
+    entry = {'check' : section.name, 'lineNum' : row.lineNum, 'line' : row.line,
+        'columns' : row.columns, 'value' : value, 'compared' : compared}
+
+    global fatalErrorCount
+
+    section.add(entry)
+
+    if section.fatal:
+        fatalErrorCount += 1
+
+    if fpQcJson:
+        entry['line'] = str.rstrip(row.line, '\r\n')
+        fpQcJson.write(json.dumps(entry) + CRT)
+
+    return 0
+
+# end addError() -------------------------------
+
+#
+# Purpose: summarize the QC run
+# Returns: dictionary {inputFile, lines, hasFatalErrors, cutShort,
+#     counts, timings}
+# Assumes: runQcChecks() has been run
+# Effects: Nothing
+# Throws: Nothing
+#
+def summarize():
+
+    return {'inputFile' : inputFile,
+        'lines' : lineCount,
+        'hasFatalErrors' : hasFatalErrors,
+        'cutShort' : cutShort,
+        'counts' : dict([(section.name, len(section)) for section in reportSections]),
+        'timings' : metrics.timings()}
+
+# end summarize() -------------------------------
+
+#
+# Purpose: write the summary of the structured QC results:
+#     per-check counts and per-phase timings
+# Returns: Nothing
+# Assumes: runQcChecks() has been run
+# Effects: writes to the QC_JSON file
+# Throws: Nothing
+#
+def writeSummary():
+
+    if not fpQcJson:
+        return 0
+
+    fpQcJson.write(json.dumps({'summary' : summarize()}) + CRT)
+
+    return 0
+
+# end writeSummary() -------------------------------
+
+#
+# Purpose: QC one file in a process whose lookups are already loaded -
+#     the QC service and batch QC run this in a forked child per file
+# Returns: summarize() of the run
+# Assumes: the QC globals are as imported (a fresh child)
+# Effects: writes the QC report and, if given, the structured QC results
+# Throws: Nothing
+#
+def qcFile(
+    fileName,		# input file
+    rptFile,		# QC report to write
+    jsonFile = None,	# structured QC results to write; None to not
+    budget = 0,		# stop after this many fatal errors (0 = no limit)
+    label = None	# input file name to report, if not fileName
+    ):
+    global inputFile, qcRptFile, qcJsonFile, maxErrors, qcCacheFile
+
+    inputFile = fileName
+    qcRptFile = rptFile
+    qcJsonFile = jsonFile
+    maxErrors = budget
+
+    # the warm lookups replace the per-line QC cache
+    qcCacheFile = None
+
+    openFiles()
+    if label:
+        inputFile = label
+    readInput()
+
+    metrics.start('runQcChecks')
+    runQcChecks()
+    metrics.stop(lineCount)
+
+    writeReport()
+    writeSummary()
+    closeFiles()
+
+    return summarize()
+
+# end qcFile() -------------------------------
+
+#
+# Purpose: compute the digest used to detect duplicate lines
+# Returns: digest (bytes) of the line without its line terminator
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+def lineDigest(line):
+
+    return hashlib.md5(str.rstrip(line, '\r\n').encode('utf-8', 'replace')).digest()
+
+# end lineDigest() -------------------------------
+
+#
+# Purpose: determine if QC should stop because the error budget is spent
+# Returns: 1 if maxErrors fatal errors have been found, else 0
+# Assumes: Nothing
+# Effects: sets cutShort
+# Throws: Nothing
+#
+def budgetSpent():
+    global cutShort
+
+    if maxErrors > 0 and fatalErrorCount >= maxErrors:
+        cutShort = 1
+
+    return cutShort
+
+# end budgetSpent() -------------------------------
+
+#
+# Purpose: checks of a line that do not need the database, other than
+#	the duplicate and reciprocal checks, which need the whole file
+# Returns: list of (section name, value, compared) for the errors found,
+#	in the order they are reported
+# Assumes: Nothing
+# Effects: Nothing - safe to run in a worker process
+# Throws: Nothing
+#
+def structureErrors(columns):
+
+    # check that the file has at least 6 columns
+    if len(columns) < 6:
+        return [('missingColumn', len(columns), 6)]
+
+    errors = []
+
+    # get columns 1-6 
+    (orgID, orgSym, partID, partSym, interactionType, jNum) = columns[:6]
+
+    # all columns required
+    if orgID == '' or orgSym == '' or partID == '' or partSym == '' or interactionType == '' or jNum == '':
+        errors.append(('reqColumn', None, None))
+
+    # are the organizer and participant different?
+    if orgID == partID:
+        errors.append(('orgPartSame', orgID, partID))
+
+    return errors
+
+# end structureErrors() -------------------------------
+
+#
+# Purpose: checks of a line against the database lookups
+# Returns: list of (section name, value, compared) for the errors found,
+#	in the order they are reported
+# Assumes: lookups have been loaded
+# Effects: Nothing - safe to run in a worker process
+# Throws: Nothing
+#
+def lookupErrors(columns):
+
+    errors = []
+
+    if len(columns) < 6:
+        return errors
+
+    (orgID, orgSym, partID, partSym, interactionType, jNum) = columns[:6]
+
+    # is orgID a qtl ID?
+    if orgID not in qtlLookup:
+        errors.append(('badQtlId', orgID, None))
+    else:
+        # does orgSym match orgID?
+       if orgSym != qtlLookup[orgID]:
+            errors.append(('idSymDiscrep', orgSym, qtlLookup[orgID]))
+    # is partID  a qtl ID?
+    if partID not in qtlLookup:
+        errors.append(('badQtlId', partID, None))
+    else:
+        # does partSym match partID?
+       if partSym != qtlLookup[partID]:
+            errors.append(('idSymDiscrep', partSym, qtlLookup[partID]))
+    # is interactionType a real term?
+    if interactionType not in interactionLookup:
+        errors.append(('badIntTerm', interactionType, None))
+    
+    if jNum not in jNumLookup:
+        errors.append(('badJnum', jNum, None))
+
+    return errors
+
+# end lookupErrors() -------------------------------
+
+#
+# Purpose: split a list of lines into chunks for the worker processes
+# Returns: list of (start, end) slice bounds
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+def chunkBounds(count):
+
+    return [(i, min(i + qcChunkSize, count)) for i in range(0, count, qcChunkSize)]
+
+# end chunkBounds() -------------------------------
+
+#
+# Purpose: run a chunk function over a list of chunks, serially or in
+#	a pool of qcWorkers worker processes
+# Returns: generator of the chunk results, in chunk order
+# Assumes: the globals the function reads were set before the call;
+#	the workers share them copy-on-write
+# Effects: forks qcWorkers processes when parallel QC is on
+# Throws: Nothing
+#
+def mapChunks(function, chunkList):
+
+    if qcWorkers <= 1 or len(chunkList) <= 1 or \
+            'fork' not in multiprocessing.get_all_start_methods():
+        for bounds in chunkList:
+            yield function(bounds)
+        return
+
+    # imap returns the chunks in input order
+    pool = multiprocessing.get_context('fork').Pool(min(qcWorkers, len(chunkList)))
+    try:
+        for result in pool.imap(function, chunkList):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+# end mapChunks() -------------------------------
+
+#
+# Purpose: parse a slice of inputLines and run the checks that need
+#	neither the database nor the whole file - the worker function
+#	of the structural checks
+# Returns: tuple (digests, errors, pairs, pending, cached, values):
+#	digests - line digest of each line
+#	errors - [(line index, [(section name, value, compared), ...]), ...]
+#	    for the lines with errors
+#	pairs - (organizer key, participant key) of each line, None for
+#	    a line with < 6 columns
+#	pending - indexes of the lines not in the QC cache
+#	cached - like errors, the cached lookup errors of the other lines
+#	values - (QTL IDs, terms, JNums) of the pending lines
+# Assumes: inputLines or inputRecords, and qcCache were set before the fork
+# Effects: Nothing
+# Throws: Nothing
+#
+def scanChunk(bounds):
+
+    (start, end) = bounds
+
+    digests = []
+    errors = []
+    pairs = []
+    pending = []
+    cached = []
+    qtlIDs = set()
+    terms = set()
+    jNums = set()
+
+    for i in range(start, end):
+        row = recordAt(i)
+        columns = row.columns
+        digest = lineDigest(row.line)
+        digests.append(digest)
+
+        lineErrors = structureErrors(columns)
+        if lineErrors:
+            errors.append((i, lineErrors))
+
+        if len(columns) < 6:
+            pairs.append(None)
+            continue
+
+        pairs.append((qtlIntLib.idKey(columns[0]), qtlIntLib.idKey(columns[2])))
+
+        lineErrors = qcCache.get(digest)
+        if lineErrors is None:
+            pending.append(i)
+            qtlIDs.add(columns[0])
+            qtlIDs.add(columns[2])
+            terms.add(columns[4])
+            jNums.add(columns[5])
+        elif lineErrors:
+            cached.append((i, lineErrors))
+
+    return (digests, errors, pairs, pending, cached, (qtlIDs, terms, jNums))
+
+# end scanChunk() -------------------------------
+
+#
+# Purpose: run the structural and duplicate line checks and report
+#	their errors in input order; collect the reciprocal pairs and
+#	the values to look up
+# Returns: Nothing
+# Assumes: qcCache has been opened
+# Effects: adds to the report sections, sets lineDigestList,
+#	qtlPairList, pendingList, cachedErrorList and lookupValues
+# Throws: Nothing
+#
+def checkStructure():
+    global hasFatalErrors
+
+    chunkList = chunkBounds(lineCount)
+
+    results = mapChunks(scanChunk, chunkList)
+    try:
+        for ((start, end), (digests, errors, pairs, pending, cached, values)) in zip(chunkList, results):
+            lineDigestList.extend(digests)
+            qtlPairList.extend(pairs)
+            pendingList.extend(pending)
+            cachedErrorList.extend(cached)
+            for k in range(3):
+                lookupValues[k].update(values[k])
+
+            # line index: line number of the first occurrence, for
+            # the duplicated lines; a chunk of distinct new lines,
+            # the usual case, is added in one step
+            dupeDict = {}
+            chunkLineDict = dict(zip(reversed(digests), range(end + 1, start + 1, -1)))
+            if len(chunkLineDict) == len(digests) \
+                    and chunkLineDict.keys().isdisjoint(distinctLineDict.keys()):
+                distinctLineDict.update(chunkLineDict)
+            else:
+                for (i, digest) in zip(range(start, end), digests):
+                    first = distinctLineDict.setdefault(digest, i + 2)
+                    if first != i + 2:
+                        dupeDict[i] = first
+
+            # only the lines with errors are visited
+            errorDict = dict(errors)
+            for i in sorted(set(dupeDict) | set(errorDict)):
+                row = recordAt(i)
+                if i in dupeDict:
+                    addError(dupeLineSection, row, compared = dupeDict[i])
+                for (name, value, compared) in errorDict.get(i, []):
+                    addError(sectionDict[name], row, value = value, compared = compared)
+                    hasFatalErrors = 1
+                if budgetSpent():
+                    return 0
+    finally:
+        results.close()
+
+    return 0
+
+# end checkStructure() -------------------------------
+
+#
+# Purpose: lookup checks of a slice of pendingList - the worker
+#	function of the lookup checks
+# Returns: list of (line index, [(section name, value, compared), ...])
+#	for the lines with errors
+# Assumes: inputLines or inputRecords, pendingList and the lookups were
+#	set before the fork
+# Effects: Nothing
+# Throws: Nothing
+#
+def lookupChunk(bounds):
+
+    (start, end) = bounds
+
+    results = []
+    for i in pendingList[start:end]:
+        errors = lookupErrors(recordAt(i).columns)
+        if errors:
+            results.append((i, errors))
+
+    return results
+
+# end lookupChunk() -------------------------------
+
+#
+# Purpose: run the lookup checks and report their errors in input order;
+#	the result of a line checked by an earlier run under the same
+#	lookups is taken from the QC cache
+# Returns: Nothing
+# Assumes: checkStructure() has been run
+# Effects: adds to the report sections, updates the QC cache
+# Throws: Nothing
+#
+def checkLookups():
+    global hasFatalErrors
+
+    # lookups are only needed for the lines to check
+    if pendingList:
+        loadLookups()
+
+    # last line index whose result is known; the pending lines up to
+    # it without errors are cached as valid
+    checked = lineCount - 1
+
+    # the errors of the cached and the checked lines are merged in
+    # input order so the report is the same with or without worker
+    # processes and the cache
+    results = mapChunks(lookupChunk, chunkBounds(len(pendingList)))
+    try:
+        found = (result for chunk in results for result in chunk)
+        for (i, lineErrors) in heapq.merge(cachedErrorList, found, key = operator.itemgetter(0)):
+            qcCache.put(lineDigestList[i], lineErrors)
+            for (name, value, compared) in lineErrors:
+                addError(sectionDict[name], recordAt(i), value = value, compared = compared)
+                hasFatalErrors = 1
+                if budgetSpent():
+                    checked = i
+                    return 0
+    finally:
+        results.close()
+        if qcCache.fileName:
+            qcCache.keep(lineDigestList)
+            qcCache.putValid([lineDigestList[i] for i in pendingList if i <= checked])
+            qcCache.save()
+
+    return 0
+
+# end checkLookups() -------------------------------
+
+#
+# Purpose: check that each organizer/participant pair has its reciprocal
+# Returns: Nothing
+# Assumes: qtlPairList has been built
+# Effects: adds to the report sections
+# Throws: Nothing
+#
+def checkReciprocals():
+    global hasFatalErrors
+
+    pairDict = dict.fromkeys(qtlPairList)
+    pairDict.pop(None, None)
+
+    # pairs whose transpose is not in the input
+    missing = pairDict.keys() - set([(part, org) for (org, part) in pairDict])
+    if not missing:
+        return 0
+
+    # the lines of each missing pair, the pairs in input order
+    missingDict = {}
+    for i in [i for (i, pair) in enumerate(qtlPairList) if pair in missing]:
+        if qtlPairList[i] not in missingDict:
+            missingDict[qtlPairList[i]] = []
+        missingDict[qtlPairList[i]].append(i)
+
+    for pair in missingDict:
+        for i in missingDict[pair]:
+            row = recordAt(i)
+            (orgID, partID) = (row.columns[0], row.columns[2])
+            addError(noReciprocalSection, row,
+                value = '%s|%s' % (orgID, partID), compared = '%s|%s' % (partID, orgID))
+        hasFatalErrors = 1
+        if budgetSpent():
+            break
+
+    return 0
+
+# end checkReciprocals() -------------------------------
+
     #
     # Purpose: run all QC checks
+    #	the checks that do not need the database run first, so that with
+    #	an error budget (--fail-fast, --max-errors) a broken file stops
+    #	before the lookups are loaded
+    #	with --workers N the lines are parsed, digested and checked in
+    #	N worker processes, chunk by chunk (scanChunk, lookupChunk); only
+    #	the duplicate and reciprocal checks, which need the whole file,
+    #	and the merge of the errors in input order run here
+    #	the lookup checks run only on the lines not in the QC cache (${QC_CACHE})
     # Returns: Nothing
     # Assumes: file descriptors have been initialized
     # Effects: writes reports and the load ready file to file system
@@ -364,87 +991,25 @@ def closeFiles ():
     #
 
 def runQcChecks():
-    global hasFatalErrors, distinctLineList, dupeLineList, qtlPairDict
-    global missingColumnList, reqColumnList, orgPartSameList, badQtlIdList
-    global idSymDiscrepList, badIntTermList, noReciprocalList, badJnumList
-
-
-    header = fpInput.readline()
-    line = fpInput.readline()
-    lineNum = 1
-    while line:
-        lineNum += 1
-        #print('lineNum: %s line: %s' % (lineNum, line))
-        if line not in distinctLineList:
-            distinctLineList.append(line)
-        else:
-            dupeLineList.append('%s  %s' % (lineNum, line))
-        # check that the file has at least 23 columns
-        if len(str.split(line, TAB)) < 6:
-            missingColumnList.append('%s  %s' % (lineNum, line))
-            hasFatalErrors = 1
-            line = fpInput.readline()
-            continue
-        # get columns 1-6 
-        (orgID, orgSym, partID, partSym, interactionType, jNum) = list(map(str.strip, str.split(line, TAB)))[:6]
-
-        # all columns required
-        if orgID == '' or orgSym == '' or partID == '' or partSym == '' or interactionType == '' or jNum == '':
-            reqColumnList.append('%s  %s' % (lineNum, line))
-            hasFatalErrors = 1
-
-        # add the qtl org and part to the qtlPairDict - later we will check for reciprocals
-        key = '%s|%s' % (orgID, partID)
-        if key not in qtlPairDict:
-            qtlPairDict[key] = []
-        qtlPairDict[key].append('%s %s' % (lineNum, line))
-
-        # Now verify each column
-
-        # are the organizer and participant different?
-        if orgID == partID:
-            orgPartSameList.append('%s  %s' % (lineNum, line))
-            hasFatalErrors = 1
-        # is orgID a qtl ID?
-        if orgID not in qtlLookupDict:
-            badQtlIdList.append('%s  %s' % (lineNum, line))
-            hasFatalErrors = 1
-        else:
-            # does orgSym match orgID?
-           if orgSym != qtlLookupDict[orgID]:
-                idSymDiscrepList.append('%s  %s' % (lineNum, line))
-                hasFatalErrors = 1
-        # is partID  a qtl ID?
-        if partID not in qtlLookupDict:
-            badQtlIdList.append('%s  %s' % (lineNum, line))
-            hasFatalErrors = 1
-        else:
-            # does partSym match partID?
-           if partSym != qtlLookupDict[partID]:
-                idSymDiscrepList.append('%s  %s' % (lineNum, line))
-                hasFatalErrors = 1
-        # is interactionType a real term?
-        if interactionType not in interactionLookupList:
-            badIntTermList.append('%s  %s' % (lineNum, line))
-            hasFatalErrors = 1
-        
-        if jNum not in jNumLookupList:
-            badJnumList.append('%s  %s' % (lineNum, line))
-            hasFatalErrors = 1
-        
-        line = fpInput.readline()
+    global qcCache
+
+    # the QC cache is valid for the lookups of the snapshot probes
+    snapshot = qtlIntLib.openSnapshot(lookupCacheFile)
+    qcCache = qtlIntLib.QcCache(qcCacheFile, snapshot.probes)
+    qcCache.open()
+
+    checkStructure()
+    if cutShort:
+        return 0
+
+    # Now verify each column
+    checkLookups()
+    if cutShort:
+        return 0
+
     # now check for reciprocals
-    #for key in qtlPairDict:
-    #    print('%s: %s' % (key, qtlPairDict[key]))
-    for pair in qtlPairDict:
-        (org, part) =  str.split(pair, '|')
-        reciprocal = '%s|%s' % (part, org)
-        if reciprocal not in qtlPairDict:
-            #print('reciprocal not found')
-            pList = qtlPairDict[pair]
-            for p in pList:
-                noReciprocalList.append(p)
-            hasFatalErrors = 1
+    checkReciprocals()
+
     return 0
 
 # end runQcChecks() -------------------------------
@@ -460,34 +1025,48 @@ def writeLoadReadyFile():
 #
 # Main
 #
-print('checkArgs(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-sys.stdout.flush()
-checkArgs()
-
-print('init(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-sys.stdout.flush()
-init()
-
-print('runQcChecks(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-sys.stdout.flush()
-runQcChecks()
-
-print('writeReport(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-writeReport()
-
-# everything is fatal right now - keep to see if we will need
-#print('writeLoadReadyFile(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-#writeLoadReadyFile()
-
-print('closeFiles(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-sys.stdout.flush()
-closeFiles()
-
-db.useOneConnection(0)
-print('done: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-
-if hasFatalErrors == 1 :
-    sys.exit(2)
-else:
-    sys.exit(0)
-
+if __name__ == '__main__':
+
+    qtlIntLib.startProfile('qtlIntQC')
+
+    print('checkArgs(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
+    sys.stdout.flush()
+    checkArgs()
+
+    print('init(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
+    sys.stdout.flush()
+    metrics.start('init')
+    init()
+    metrics.stop(lineCount)
+
+    print('runQcChecks(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
+    sys.stdout.flush()
+    metrics.start('runQcChecks')
+    runQcChecks()
+    metrics.stop(lineCount)
+
+    print('writeReport(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
+    metrics.start('writeReport')
+    writeReport()
+    metrics.stop(sum([len(section) for section in reportSections]))
+    writeSummary()
+
+    # everything is fatal right now - keep to see if we will need
+    #print('writeLoadReadyFile(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
+    #writeLoadReadyFile()
+
+    print('closeFiles(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
+    sys.stdout.flush()
+    closeFiles()
+
+    qtlIntLib.waitSnapshots()
+    db.useOneConnection(0)
+    metrics.write(sys.stdout)
+    metrics.save()
+    qtlIntLib.saveProfile()
+    print('done: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
+
+    if hasFatalErrors == 1 :
+        sys.exit(2)
+    else:
+        sys.exit(0)
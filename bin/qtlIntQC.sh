@@ -10,9 +10,12 @@
 #
 #  Usage:
 #
-#      qtlIntQC.sh  filename  
+#      qtlIntQC.sh  [--fail-fast | --max-errors N] [--workers N]  filename  
 #
 #      where
+#          --fail-fast = stop at the first fatal QC error
+#          --max-errors N = stop after N fatal QC errors
+#          --workers N = run the lookup checks in N processes
 #          filename = full path to the input file
 #
 #  Env Vars:
@@ -25,6 +28,7 @@
 #  Outputs:
 #
 #      - QC report for the input file 	
+#      - structured QC results (${QC_JSON})
 #      - Log file (${QC_LOGFILE})
 #
 #  Exit Codes:
@@ -46,7 +50,8 @@
 #      4) Update path to QC reports if this is not a 'live' run 
 #	     i.e. curators running the scripts 
 #      5) Initialize the log file
-#      6) Call qtlIntQC.py to generate the QC report
+#      6) Call qtlIntQC.py to generate the QC report; curator runs send
+#	  the job to the QC service (qtlIntQCClient.py) when it is running
 #
 #
 #  Notes:  None
@@ -65,11 +70,29 @@ CURRENTDIR=`pwd`
 BINDIR=`dirname $0`
 
 CONFIG=`cd ${BINDIR}/..; pwd`/qtlinteractionload.config
-USAGE='Usage: qtlIntQC.sh  filename'
+USAGE='Usage: qtlIntQC.sh  [--fail-fast | --max-errors N] [--workers N]  filename'
 
 # set LIVE_RUN  to QC check only as the default
 LIVE_RUN=0; export LIVE_RUN
 
+#
+# Options passed through to qtlIntQC.py; a partial report is written
+# when QC stops early.
+#
+QC_OPTS=""
+while [ $# -gt 0 ]
+do
+    case "$1" in
+	--fail-fast) QC_OPTS="${QC_OPTS} --fail-fast"; shift;;
+	--max-errors) [ $# -ge 2 ] || { echo ${USAGE}; exit 1; }
+		QC_OPTS="${QC_OPTS} --max-errors $2"; shift 2;;
+	--workers) [ $# -ge 2 ] || { echo ${USAGE}; exit 1; }
+		QC_OPTS="${QC_OPTS} --workers $2"; shift 2;;
+	-*) echo ${USAGE}; exit 1;;
+	*) break;;
+    esac
+done
+
 #
 # Make sure an input file was passed to the script. If the optional "live"
 # argument is given, that means that the output files are located in the
@@ -112,11 +135,25 @@ fi
 #
 # If this is not a "live" run, the output, log and report files should reside
 # in the current directory, so override the default settings.
+# The lookup snapshot and the QC cache are kept in the curator's HOME
+# directory so that repeated QC runs can reuse them.
 #
 if [ ${LIVE_RUN} -eq 0 ]
 then
 	QC_RPT=${CURRENTDIR}/`basename ${QC_RPT}`
 	QC_LOGFILE=${CURRENTDIR}/`basename ${QC_LOGFILE}`
+	if [ "${QC_JSON}" != "" ]
+	then
+	    QC_JSON=${CURRENTDIR}/`basename ${QC_JSON}`
+	fi
+	if [ "${LOOKUP_CACHE}" != "" ]
+	then
+	    LOOKUP_CACHE=${HOME}/.qtlinteractionload/`basename ${LOOKUP_CACHE}`
+	fi
+	if [ "${QC_CACHE}" != "" ]
+	then
+	    QC_CACHE=${HOME}/.qtlinteractionload/`basename ${QC_CACHE}`
+	fi
 
 fi
 
@@ -128,10 +165,10 @@ rm -rf ${LOG}
 touch ${LOG}
 
 #
-# Convert the input file into a QC-ready version that can be used to run
-# the QC reports against.
+# The input file is not converted here (e.g. with dos2unix): the QC and
+# the load normalize line endings, byte order marks and encoding as
+# they read it, so the published file is never rewritten.
 #
-dos2unix ${INPUT_FILE} ${INPUT_FILE} 2>/dev/null
 
 #
 # Create a temporary file and make sure it is removed when this script
@@ -157,7 +194,21 @@ fi
 echo "" >> ${LOG}
 date >> ${LOG}
 echo "Generate the QC reports" >> ${LOG}
-{ ${PYTHON} ${QTLINTERACTIONLOAD}/bin/qtlIntQC.py ${INPUT_FILE} 2>&1; echo $? > ${TMP_FILE}; } >> ${LOG}
+
+#
+# Curator runs use the QC service (qtlIntQCService.sh) if it is running;
+# exit code 3 means it did not answer and QC is run here instead.
+#
+echo 3 > ${TMP_FILE}
+if [ ${LIVE_RUN} -eq 0 -a "${QC_SOCKET}" != "" -a -S "${QC_SOCKET}" ]
+then
+    { ${PYTHON} ${QTLINTERACTIONLOAD}/bin/qtlIntQCClient.py ${QC_OPTS} ${INPUT_FILE} 2>&1; echo $? > ${TMP_FILE}; } >> ${LOG}
+fi
+
+if [ `cat ${TMP_FILE}` -eq 3 ]
+then
+    { ${PYTHON} ${QTLINTERACTIONLOAD}/bin/qtlIntQC.py ${QC_OPTS} ${INPUT_FILE} 2>&1; echo $? > ${TMP_FILE}; } >> ${LOG}
+fi
 
 if [ `cat ${TMP_FILE}` -eq 1 ]
 then
@@ -0,0 +1,343 @@
+#
+#  qtlIntQCBatch.py
+###########################################################################
+#
+#  Purpose:
+#
+#	Run the qtlIntQC.py checks on many input files - e.g. to
+#	re-validate saved input files after vocabulary or marker status
+#	changes. The lookups are loaded once for all files and the
+#	files are checked concurrently. Archives (e.g. the tar bundles
+#	in ${ARCHIVEDIR}) and other binary files are skipped.
+#
+#  Usage:
+#
+#      qtlIntQCBatch.py  [--max-errors N] [--jobs N]  --output-dir dir
+#			 file|glob ...
+#
+#      where:
+#          --max-errors N = stop a file after N fatal errors (${QC_MAX_ERRORS})
+#          --jobs N = check N files at a time (${QC_BATCH_JOBS})
+#          --output-dir = directory for the reports
+#          file|glob = input files; quoted globs are expanded here;
+#		binary files are skipped
+#
+#  Env Vars:
+#
+#      LOOKUP_CACHE, QC_MAX_ERRORS, QC_BATCH_JOBS
+#
+#  Outputs:
+#
+#      - per-file QC report (<output dir>/<input file>.qc.rpt) and
+#	 structured QC results (<output dir>/<input file>.qc.json)
+#      - summary of all files (<output dir>/qc_summary.rpt) and as
+#	 JSON (<output dir>/qc_summary.json)
+#
+#  Exit Codes:
+#
+#      0:  Successful completion, no QC errors
+#      1:  An exception occurred
+#      2:  QC errors in at least one file
+#
+#  Implementation:
+#
+#      1) Load all lookups in full, then close the database connection
+#      2) Check each file in a forked child that shares the lookups
+#	  copy-on-write and needs no database access; a child checks
+#	  one file so each file starts with empty QC state
+#      3) Write the summary of all files
+#
+#  History:
+#
+# sc	10/17/2026
+#	- created
+#
+###########################################################################
+
+import sys
+import os
+import glob
+import json
+import time
+import getopt
+import traceback
+import multiprocessing
+
+import qtlIntLib
+import qtlIntQC
+
+USAGE = 'Usage: qtlIntQCBatch.py  [--max-errors N] [--jobs N]  --output-dir dir  file|glob ...'
+
+CRT = '\n'
+
+# input files, in the order given
+inputFileList = []
+
+# directory for the reports
+outputDir = None
+
+# stop a file after this many fatal errors; 0 checks the whole file
+maxErrors = int(os.getenv('QC_MAX_ERRORS', '0'))
+
+# files checked at a time
+batchJobs = int(os.getenv('QC_BATCH_JOBS', '4'))
+
+# leading bytes of the compressed and archive formats: gzip, bzip2,
+# xz, zip; a tar file has NUL bytes in its header
+archiveMagic = (b'\x1f\x8b', b'BZh', b'\xfd7zXZ\x00', b'PK\x03\x04')
+
+# phase timings, written to stdout and ${LOGDIR}/qtlIntQCBatch.metrics
+metrics = qtlIntLib.PhaseMetrics('qtlIntQCBatch')
+
+#
+# Purpose: Validate the arguments to the script.
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: sets global variables, exits if the arguments are not valid
+# Throws: Nothing
+#
+def checkArgs():
+    global outputDir, maxErrors, batchJobs
+
+    try:
+        optList, args = getopt.getopt(sys.argv[1:], '', ['max-errors=', 'jobs=', 'output-dir='])
+        for (opt, value) in optList:
+            if opt == '--max-errors':
+                maxErrors = int(value)
+                if maxErrors < 0:
+                    raise ValueError(value)
+            elif opt == '--jobs':
+                batchJobs = max(int(value), 1)
+            elif opt == '--output-dir':
+                outputDir = value
+    except (getopt.GetoptError, ValueError):
+        print(USAGE)
+        sys.exit(1)
+
+    if not outputDir or not args:
+        print(USAGE)
+        sys.exit(1)
+
+    for arg in args:
+        names = sorted(glob.glob(arg))
+        if not names:
+            print('No input files match: %s' % arg)
+            sys.exit(1)
+        for name in names:
+            if not os.path.isfile(name) or name in inputFileList:
+                continue
+            if not isTextFile(name):
+                print('Skipping archive or binary file: %s' % name)
+                continue
+            inputFileList.append(name)
+
+    if not inputFileList:
+        print('No input files to check')
+        sys.exit(1)
+
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+
+    return 0
+
+# end checkArgs() -------------------------------
+
+#
+# Purpose: tell input files from archives and other binary files
+# Returns: 1 if the file looks like text, else 0
+# Assumes: Nothing
+# Effects: reads the start of the file
+# Throws: Nothing
+#
+def isTextFile(fileName):
+
+    try:
+        with open(fileName, 'rb') as fp:
+            block = fp.read(8192)
+    except (IOError, OSError):
+        return 0
+
+    if block.startswith(archiveMagic) or b'\x00' in block:
+        return 0
+
+    return 1
+
+# end isTextFile() -------------------------------
+
+#
+# Purpose: name the report files of each input file; input files with
+#	the same base name (from different directories) are numbered
+# Returns: list of (inputFile, reportBase) in inputFileList order
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+def reportNames():
+
+    names = []
+    used = set()
+
+    for inputFile in inputFileList:
+        base = os.path.basename(inputFile)
+        name = base
+        i = 1
+        while name in used:
+            i += 1
+            name = '%s.%d' % (base, i)
+        used.add(name)
+        names.append((inputFile, os.path.join(outputDir, name)))
+
+    return names
+
+# end reportNames() -------------------------------
+
+#
+# Purpose: load the lookups in full for all files
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: queries a database, writes the lookup snapshot, sets the
+#	snapshot qtlIntQC uses
+# Throws: Nothing
+#
+def loadLookups():
+
+    qtlIntLib.preloadSnapshot(qtlIntQC.lookupCacheFile)
+
+    return 0
+
+# end loadLookups() -------------------------------
+
+#
+# Purpose: QC one input file
+# Returns: qtlIntQC.summarize() of the file plus the report file names;
+#	'error' instead if the QC failed
+# Assumes: running in a forked child that checks only this file
+# Effects: writes the file's QC report and structured QC results
+# Throws: Nothing
+#
+def qcOne(names):
+
+    inputFile, reportBase = names
+    result = {'inputFile' : inputFile,
+        'report' : reportBase + '.qc.rpt',
+        'json' : reportBase + '.qc.json'}
+
+    # the files are the unit of concurrency
+    qtlIntQC.qcWorkers = 1
+
+    # qtlIntQC prints its progress; keep the batch output to one line per file
+    sys.stdout = open(os.devnull, 'w')
+
+    try:
+        result.update(qtlIntQC.qcFile(inputFile, result['report'], result['json'], maxErrors))
+    except BaseException:
+        result['error'] = traceback.format_exc()
+
+    return result
+
+# end qcOne() -------------------------------
+
+#
+# Purpose: QC all input files, maxJobs at a time
+# Returns: list of qcOne() results in inputFileList order
+# Assumes: loadLookups() has been run
+# Effects: forks a child per file
+# Throws: Nothing
+#
+def qcAll():
+
+    results = []
+    context = multiprocessing.get_context('fork')
+
+    with context.Pool(batchJobs, maxtasksperchild = 1) as pool:
+        for result in pool.imap(qcOne, reportNames()):
+            if 'error' in result:
+                status = 'failed'
+            elif result['hasFatalErrors']:
+                status = 'QC errors'
+            else:
+                status = 'ok'
+            print('%s: %s' % (result['inputFile'], status))
+            sys.stdout.flush()
+            results.append(result)
+
+    return results
+
+# end qcAll() -------------------------------
+
+#
+# Purpose: write the summary of all files
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: writes qc_summary.rpt and qc_summary.json to outputDir
+# Throws: Nothing
+#
+def writeSummary(results):
+
+    sections = qtlIntQC.reportSections
+    names = [section.name for section in sections]
+
+    with open(os.path.join(outputDir, 'qc_summary.json'), 'w') as fp:
+        json.dump({'maxErrors' : maxErrors, 'files' : results}, fp, indent = 1)
+
+    with open(os.path.join(outputDir, 'qc_summary.rpt'), 'w') as fp:
+        fp.write('QC of %d file(s) %s%s' % (len(results), time.strftime('%c'), CRT))
+        for section in sections:
+            fp.write('%s%s = %s' % (CRT, section.name, section.title))
+        fp.write(CRT + CRT)
+
+        fp.write('\t'.join(['File', 'Lines', 'Status'] + names) + CRT)
+        for result in results:
+            if 'error' in result:
+                row = [result['inputFile'], '', 'failed'] + [''] * len(names)
+            else:
+                status = 'ok'
+                if result['hasFatalErrors']:
+                    status = 'QC errors'
+                if result['cutShort']:
+                    status = status + ' (incomplete)'
+                row = [result['inputFile'], str(result['lines']), status] + \
+                    [str(result['counts'][name]) for name in names]
+            fp.write('\t'.join(row) + CRT)
+
+        failed = [result for result in results if 'error' in result]
+        for result in failed:
+            fp.write('%s%s failed:%s%s' % (CRT, result['inputFile'], CRT, result['error']))
+
+    return 0
+
+# end writeSummary() -------------------------------
+
+#
+# Main
+#
+if __name__ == '__main__':
+
+    checkArgs()
+
+    qtlIntLib.startProfile('qtlIntQCBatch')
+
+    print('%s loading lookups' % time.strftime('%c'))
+    sys.stdout.flush()
+    metrics.start('loadLookups')
+    loadLookups()
+    metrics.stop()
+
+    metrics.start('qcAll')
+    results = qcAll()
+    metrics.stop(sum([result.get('lines', 0) for result in results]))
+
+    writeSummary(results)
+
+    metrics.write(sys.stdout)
+    metrics.save()
+    qtlIntLib.saveProfile()
+
+    print('summary: %s' % os.path.join(outputDir, 'qc_summary.rpt'))
+
+    if [result for result in results if 'error' in result]:
+        sys.exit(1)
+    elif [result for result in results if result['hasFatalErrors']]:
+        sys.exit(2)
+    else:
+        sys.exit(0)
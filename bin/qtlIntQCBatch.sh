@@ -0,0 +1,102 @@
+#!/bin/sh
+#
+#  qtlIntQCBatch.sh
+###########################################################################
+#
+#  Purpose:
+#
+#      Run the QC checks on many input files with one lookup load,
+#      e.g. to re-validate saved input files after vocabulary or marker
+#      status changes. ${ARCHIVEDIR} holds tar bundles, not input
+#      files - extract the input files to a directory first.
+#
+#  Usage:
+#
+#      qtlIntQCBatch.sh  [--max-errors N] [--jobs N]  outputDir  file|glob ...
+#
+#      where
+#          --max-errors N = stop a file after N fatal QC errors
+#          --jobs N = check N files at a time (${QC_BATCH_JOBS})
+#          outputDir = directory for the per-file reports and the summary
+#          file|glob = input files; quote a glob to expand it in
+#		qtlIntQCBatch.py, e.g. "inputs/*.txt" for a directory
+#		of saved input files; archives and other binary files
+#		are skipped
+#
+#  Env Vars:
+#
+#      See the configuration file
+#
+#  Outputs:
+#
+#      - per-file QC reports and the summary (outputDir/qc_summary.rpt)
+#      - Log file (${LOGDIR}/qtlIntQCBatch.log)
+#
+#  Exit Codes:
+#
+#      0:  Successful completion, no QC errors
+#      1:  Fatal error occurred
+#      2:  QC errors in at least one file (see outputDir/qc_summary.rpt)
+#
+###########################################################################
+
+BINDIR=`dirname $0`
+CONFIG=`cd ${BINDIR}/..; pwd`/qtlinteractionload.config
+USAGE='Usage: qtlIntQCBatch.sh  [--max-errors N] [--jobs N]  outputDir  file|glob ...'
+
+QC_OPTS=""
+while [ $# -gt 0 ]
+do
+    case "$1" in
+	--max-errors|--jobs) [ $# -ge 2 ] || { echo ${USAGE}; exit 1; }
+		QC_OPTS="${QC_OPTS} $1 $2"; shift 2;;
+	-*) echo ${USAGE}; exit 1;;
+	*) break;;
+    esac
+done
+
+if [ $# -lt 2 ]
+then
+    echo ${USAGE}; exit 1
+fi
+
+OUTPUT_DIR=$1
+shift
+
+#
+# Make sure the configuration file exists and source it.
+#
+if [ -f ${CONFIG} ]
+then
+    . ${CONFIG}
+else
+    echo "Missing configuration file: ${CONFIG}"
+    exit 1
+fi
+
+LOG=${LOGDIR}/qtlIntQCBatch.log
+
+#
+# Create a temporary file for the exit code and make sure it is removed
+# when this script terminates.
+#
+TMP_FILE=/tmp/`basename $0`.$$
+trap "rm -f ${TMP_FILE}" 0 1 2 15
+
+echo "" >> ${LOG}
+date >> ${LOG}
+
+{ ${PYTHON} ${QTLINTERACTIONLOAD}/bin/qtlIntQCBatch.py ${QC_OPTS} --output-dir ${OUTPUT_DIR} "$@" 2>&1; echo $? > ${TMP_FILE}; } | tee -a ${LOG}
+RC=`cat ${TMP_FILE}`
+
+if [ ${RC} -eq 1 ]
+then
+    echo "An error occurred during batch QC, see log file (${LOG})"
+elif [ ${RC} -eq 2 ]
+then
+    echo "QC errors detected, see ${OUTPUT_DIR}/qc_summary.rpt"
+fi
+
+date >> ${LOG}
+
+exit ${RC}
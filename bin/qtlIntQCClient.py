@@ -0,0 +1,136 @@
+#
+#  qtlIntQCClient.py
+###########################################################################
+#
+#  Purpose:
+#
+#	Send a QC job to the QC service (qtlIntQCService.py) and write
+#	its QC report (${QC_RPT}) and structured QC results (${QC_JSON})
+#	as qtlIntQC.py would. Only standard modules are imported, so the
+#	client starts quickly.
+#
+#  Usage:
+#
+#      qtlIntQCClient.py  [--fail-fast] [--max-errors N] [--workers N]  filename
+#
+#	--workers is accepted for qtlIntQC.py compatibility and ignored
+#
+#  Env Vars:
+#
+#      QC_SOCKET, QC_RPT, QC_JSON, QC_MAX_ERRORS, QC_SERVICE_TIMEOUT
+#
+#  Exit Codes:
+#
+#      0:  Successful completion, no QC errors
+#      1:  The QC job failed
+#      2:  QC errors
+#      3:  The service is not available - run qtlIntQC.py instead
+#
+#  History:
+#
+# sc	10/17/2026
+#	- created
+#
+###########################################################################
+
+import sys
+import os
+import json
+import getopt
+import socket
+
+USAGE = 'Usage: qtlIntQCClient.py  [--fail-fast] [--max-errors N] [--workers N]  inputFile'
+
+NO_SERVICE = 3
+
+socketFile = os.getenv('QC_SOCKET')
+qcRptFile = os.getenv('QC_RPT')
+qcJsonFile = os.getenv('QC_JSON')
+
+# seconds to wait for the QC of one file
+timeout = int(os.getenv('QC_SERVICE_TIMEOUT', '300'))
+
+#
+# Purpose: send the job and wait for the response
+# Returns: response dictionary, None if the service is not available
+# Assumes: Nothing
+# Effects: connects to the service
+# Throws: Nothing
+#
+def submit(request):
+
+    if not socketFile:
+        return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(5)
+        client.connect(socketFile)
+        client.settimeout(timeout)
+        client.sendall((json.dumps(request) + '\n').encode('utf-8'))
+
+        data = []
+        while True:
+            block = client.recv(1024 * 1024)
+            if not block:
+                break
+            data.append(block)
+
+        return json.loads(b''.join(data).decode('utf-8'))
+    except (OSError, ValueError):
+        return None
+    finally:
+        client.close()
+
+# end submit() -------------------------------
+
+if __name__ == '__main__':
+
+    maxErrors = int(os.getenv('QC_MAX_ERRORS', '0'))
+
+    try:
+        optList, args = getopt.getopt(sys.argv[1:], '', ['fail-fast', 'max-errors=', 'workers='])
+        for (opt, value) in optList:
+            if opt == '--fail-fast':
+                maxErrors = 1
+            elif opt == '--max-errors':
+                maxErrors = int(value)
+                if maxErrors < 0:
+                    raise ValueError(value)
+    except (getopt.GetoptError, ValueError):
+        print(USAGE)
+        sys.exit(1)
+
+    if len(args) != 1:
+        print(USAGE)
+        sys.exit(1)
+
+    inputFile = args[0]
+
+    try:
+        with open(inputFile, 'r', encoding = 'utf-8', errors = 'replace', newline = '') as fp:
+            content = fp.read()
+    except (IOError, OSError):
+        print('Cannot open input file: %s' % inputFile)
+        sys.exit(1)
+
+    response = submit({'inputFile' : inputFile, 'content' : content,
+        'maxErrors' : maxErrors, 'json' : bool(qcJsonFile)})
+
+    if response is None:
+        print('QC service not available: %s' % socketFile)
+        sys.exit(NO_SERVICE)
+
+    sys.stdout.write(response['log'])
+
+    if response['exitCode'] == 1:
+        sys.exit(1)
+
+    with open(qcRptFile, 'w') as fp:
+        fp.write(response['report'])
+
+    if qcJsonFile and response['json'] is not None:
+        with open(qcJsonFile, 'w') as fp:
+            fp.write(response['json'])
+
+    sys.exit(response['exitCode'])
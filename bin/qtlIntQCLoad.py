@@ -0,0 +1,151 @@
+#
+# qtlIntQCLoad.py
+###############################################################################
+#
+#  Purpose:
+#
+#      QC and load QTL to QTL Interaction relationships in a single pass:
+#      the input is parsed once, all QC checks are run against the parsed
+#      records and, only if QC passes, MGI_Relationship.bcp is written
+#      from the same records and loaded
+#
+#  Usage:
+#
+#      qtlIntQCLoad.py
+#
+#  Env Vars:
+#
+#      See the configuration file; QC_RPT and the qtlinteractionload.py
+#      settings (INPUT_FILE_DEFAULT, OUTPUTDIR, LOG_DEBUG, LOOKUP_CACHE)
+#
+#  Inputs:
+#
+#      ${INPUT_FILE_DEFAULT} - see qtlinteractionload.py
+#
+#  Outputs:
+#
+#      - QC report (${QC_RPT}) - see qtlIntQC.py
+#      - MGI_Relationship.bcp, diagnostics and error files
+#	 - see qtlinteractionload.py
+#
+#  Exit Codes:
+#
+#      0:  Successful completion
+#      1:  An exception occurred
+#      2:  QC errors - the load was not run
+#
+#  Implementation:
+#
+#      1) Open the QC files and parse the input (qtlIntQC.init)
+#      2) Initialize the load; stop if the input and its resolved keys
+#	  are unchanged since the last load (${LASTRUN_FILE})
+#      3) Run the QC checks and write the QC report
+#      4) Exit 2 if there are fatal QC errors
+#      5) Resolve the parsed records to keys and write the bcp file
+#	  (qtlinteractionload.processRelationships)
+#      6) Delete existing relationships, bcp in the new ones and record
+#	  the digests of the input and resolved keys
+#      7) Verify the loaded relationships (qtlinteractionload.verifyLoad)
+#
+# History:
+#
+# sc	10/17/2026
+#	- created
+#
+
+import sys
+import time
+
+import mgi_utils
+import qtlIntLib
+import qtlIntQC
+import qtlinteractionload
+
+# one set of phase timings for the QC and the load, written to the
+# diagnostics file and ${LOGDIR}/qtlIntQCLoad.metrics by qtlinteractionload.exit()
+metrics = qtlIntLib.PhaseMetrics('qtlIntQCLoad')
+qtlIntQC.metrics = metrics
+qtlinteractionload.metrics = metrics
+
+#
+# Main
+#
+
+qtlIntLib.startProfile('qtlIntQCLoad')
+
+print('init(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
+sys.stdout.flush()
+qtlIntQC.inputFile = qtlinteractionload.inputFileName
+metrics.start('init')
+qtlIntQC.init()
+# the load needs every line parsed, even if the QC checks run in workers
+qtlIntQC.parseInput()
+metrics.stop(len(qtlIntQC.inputRecords))
+
+print('%s' % mgi_utils.date())
+print ('initialize()')
+metrics.start('initialize')
+if qtlinteractionload.initialize() != 0:
+    qtlinteractionload.exit(1, 'Error in  initialize \n' )
+metrics.stop()
+
+# nothing to do if the input and its resolved keys are unchanged
+if qtlinteractionload.isUnchanged(qtlIntQC.inputRecords):
+    qtlIntQC.fpQcRpt.write('Input file and resolved keys unchanged since the last load - QC not run')
+    qtlIntQC.closeFiles()
+    qtlinteractionload.exit(0, 'qtlIntQCLoad successful - no changes to load')
+
+print('runQcChecks(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
+sys.stdout.flush()
+metrics.start('runQcChecks')
+qtlIntQC.runQcChecks()
+metrics.stop(len(qtlIntQC.inputRecords))
+
+print('writeReport(): %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
+metrics.start('writeReport')
+qtlIntQC.writeReport()
+metrics.stop(sum([len(section) for section in qtlIntQC.reportSections]))
+qtlIntQC.writeSummary()
+qtlIntQC.closeFiles()
+
+if qtlIntQC.hasFatalErrors == 1:
+    print('QC errors detected. The load will not run. See %s' % qtlIntQC.qcRptFile)
+    qtlinteractionload.exit(2)
+
+print('%s' % mgi_utils.date())
+print('processRelationships()')
+# write the qc'd records to bcp
+metrics.start('processRelationships')
+if qtlinteractionload.processRelationships(qtlIntQC.inputRecords) != 0:
+    qtlinteractionload.exit(1, 'Error in  processRelationships \n' )
+metrics.stop(len(qtlinteractionload.bcpRowList))
+
+print('%s' % mgi_utils.date())
+print('doDeletes()')
+metrics.start('doDeletes')
+if qtlinteractionload.doDeletes() != 0:
+    qtlinteractionload.exit(1, 'Error in  doDeletes \n' )
+metrics.stop(len(qtlinteractionload.deleteKeyList))
+
+print('%s' % mgi_utils.date())
+print('closeFiles()')
+if qtlinteractionload.closeFiles() != 0:
+    qtlinteractionload.exit(1, 'Error in  closeFiles \n' )
+
+print('%s' % mgi_utils.date())
+print('bcpFiles()')
+metrics.start('bcpFiles')
+if qtlinteractionload.bcpFiles() != 0:
+    qtlinteractionload.exit(1, 'Error in  bcpFiles \n' )
+metrics.stop(len(qtlinteractionload.bcpRowList))
+
+print('%s' % mgi_utils.date())
+print('verifyLoad()')
+metrics.start('verifyLoad')
+if qtlinteractionload.verifyLoad() != 0:
+    qtlinteractionload.exit(1, 'Error in  verifyLoad - see %s \n' % qtlinteractionload.diagFileName)
+metrics.stop(qtlinteractionload.expectedChecksum[0])
+
+qtlinteractionload.writeLastrun()
+
+qtlinteractionload.exit(0, 'qtlIntQCLoad successful')
@@ -0,0 +1,321 @@
+#
+#  qtlIntQCService.py
+###########################################################################
+#
+#  Purpose:
+#
+#	Long-running QC service for curator QC runs. It keeps the QTL ID,
+#	interaction term and JNum lookups loaded and runs the qtlIntQC.py
+#	checks for jobs sent over a local UNIX socket (${QC_SOCKET}),
+#	so a curator QC run does not pay for interpreter start up, the
+#	database connection and the lookup loading.
+#
+#	qtlIntQC.sh sends jobs with qtlIntQCClient.py when the socket
+#	exists and falls back to running qtlIntQC.py when the service
+#	does not answer.
+#
+#  Usage:
+#
+#      qtlIntQCService.py
+#
+#	started and stopped by qtlIntQCService.sh
+#
+#  Env Vars:
+#
+#      QC_SOCKET - path of the UNIX socket
+#      QC_SOCKET_GROUP - group allowed to send jobs
+#      QC_SERVICE_REFRESH - seconds between freshness probes of the lookups
+#      QC_SERVICE_JOBS - jobs run at a time
+#      QC_SERVICE_TIMEOUT - seconds a job may take to be sent and answered
+#      QC_SERVICE_MAX_REQUEST - largest input file accepted, in MB
+#      LOOKUP_CACHE - lookup snapshot read at start up and kept up to date
+#
+#  Protocol:
+#
+#      Request: one JSON line
+#	   {inputFile, content, maxErrors, json}
+#      Response: one JSON line
+#	   {exitCode, report, json, log}
+#	   exitCode: 0 no QC errors, 1 the job failed, 2 QC errors
+#
+#  Implementation:
+#
+#      1) Load all lookups in full, then close the database connection
+#      2) Accept jobs; each job runs in a forked child that shares the
+#	  lookups copy-on-write and needs no database access, so jobs
+#	  run concurrently and cannot disturb each other's QC state. At
+#	  most ${QC_SERVICE_JOBS} jobs run at a time; further jobs wait in
+#	  the socket's listen queue. Larger files are refused; the client
+#	  then runs qtlIntQC.py itself.
+#      3) Between jobs, every ${QC_SERVICE_REFRESH} seconds, re-run the
+#	  freshness probe and reload the lookups whose tables changed
+#
+#  History:
+#
+# sc	10/17/2026
+#	- created
+#
+###########################################################################
+
+import sys
+import os
+import io
+import grp
+import time
+import json
+import signal
+import socket
+import tempfile
+import traceback
+
+import qtlIntLib
+import qtlIntQC
+
+socketFile = os.environ['QC_SOCKET']
+
+# group of the socket; only its members (and the owner) may send jobs
+socketGroup = os.getenv('QC_SOCKET_GROUP', 'mgi')
+
+# seconds between freshness probes of the lookups
+refreshSeconds = int(os.getenv('QC_SERVICE_REFRESH', '300'))
+
+# jobs (forked children) run at a time
+maxJobs = max(int(os.getenv('QC_SERVICE_JOBS', '4')), 1)
+
+# seconds a child waits for its request or for the client to take the
+# response; the client gives up after the same time
+jobSeconds = int(os.getenv('QC_SERVICE_TIMEOUT', '300'))
+
+# largest request accepted (bytes)
+maxRequest = int(os.getenv('QC_SERVICE_MAX_REQUEST', '32')) * 1024 * 1024
+
+# the warm lookups and when they were last probed
+snapshot = None
+lastRefresh = 0
+
+#
+# Purpose: load the lookups in full, or reload those whose tables
+#	changed since the last probe; the reload goes into a copy of the
+#	snapshot that replaces it only once it is loaded, so a failed
+#	reload leaves the lookups being served as they were
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: queries a database, writes the lookup snapshot, sets the
+#	snapshot qtlIntQC uses
+# Throws: database errors; lastRefresh is set anyway, so a failed
+#	reload is retried after refreshSeconds
+#
+def refresh():
+    global snapshot, lastRefresh
+
+    lastRefresh = time.time()
+
+    fresh = qtlIntLib.preloadSnapshot(qtlIntQC.lookupCacheFile, snapshot)
+
+    if snapshot is not None:
+        reloaded = [kind for kind in fresh.kinds if fresh.kinds[kind] is not snapshot.kinds[kind]]
+        if reloaded:
+            print('%s lookups changed, reloaded: %s' % (time.strftime('%c'), ', '.join(reloaded)))
+
+    snapshot = fresh
+    sys.stdout.flush()
+
+    return 0
+
+# end refresh() -------------------------------
+
+#
+# Purpose: read one JSON line from a connection
+# Returns: dictionary
+# Assumes: Nothing
+# Effects: reads from the connection
+# Throws: ValueError if the request is too large or not JSON
+#
+def readRequest(conn):
+
+    data = []
+    size = 0
+    while True:
+        block = conn.recv(1024 * 1024)
+        if not block:
+            break
+        data.append(block)
+        size += len(block)
+        if size > maxRequest:
+            raise ValueError('request larger than %s bytes' % maxRequest)
+        if block.endswith(b'\n'):
+            break
+
+    return json.loads(b''.join(data).decode('utf-8'))
+
+# end readRequest() -------------------------------
+
+#
+# Purpose: run one QC job
+# Returns: response dictionary {exitCode, report, json, log}
+# Assumes: running in a forked child with the lookups loaded
+# Effects: sets the qtlIntQC globals, writes and removes temporary files
+# Throws: Nothing
+#
+def runJob(request):
+
+    log = io.StringIO()
+    sys.stdout = log
+    workDir = tempfile.mkdtemp(prefix = 'qtlIntQC.')
+    response = {'exitCode' : 1, 'report' : '', 'json' : None, 'log' : ''}
+
+    try:
+        inputFile = os.path.join(workDir, 'input')
+        with open(inputFile, 'w', encoding = 'utf-8') as fp:
+            fp.write(request['content'])
+
+        rptFile = os.path.join(workDir, 'qc.rpt')
+        jsonFile = os.path.join(workDir, 'qc.json') if request.get('json') else None
+        summary = qtlIntQC.qcFile(inputFile, rptFile, jsonFile,
+            int(request.get('maxErrors') or 0), request.get('inputFile'))
+        qtlIntQC.metrics.write(log)
+
+        with open(rptFile, 'r') as fp:
+            response['report'] = fp.read()
+        if jsonFile:
+            with open(jsonFile, 'r') as fp:
+                response['json'] = fp.read()
+
+        response['exitCode'] = 2 if summary['hasFatalErrors'] == 1 else 0
+    except BaseException:
+        traceback.print_exc(file = log)
+
+    for name in os.listdir(workDir):
+        os.remove(os.path.join(workDir, name))
+    os.rmdir(workDir)
+
+    response['log'] = log.getvalue()
+
+    return response
+
+# end runJob() -------------------------------
+
+#
+# Purpose: answer one connection in a forked child
+# Returns: does not return
+# Assumes: Nothing
+# Effects: runs the job, writes the response, exits the child
+# Throws: Nothing
+#
+def serve(conn):
+
+    # a client that stops sending or reading does not keep a job slot
+    conn.settimeout(jobSeconds)
+
+    status = 0
+    try:
+        response = runJob(readRequest(conn))
+        conn.sendall((json.dumps(response) + '\n').encode('utf-8'))
+    except BaseException:
+        traceback.print_exc(file = sys.__stderr__)
+        status = 1
+
+    conn.close()
+    os._exit(status)
+
+# end serve() -------------------------------
+
+#
+# Purpose: reap the children that have finished
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: removes their process ids from children
+# Throws: Nothing
+#
+def reapChildren(
+    children,		# set of child process ids
+    wait = 0		# 1 to wait until at least one child finishes
+    ):
+
+    while children:
+        try:
+            pid, status = os.waitpid(-1, 0 if wait else os.WNOHANG)
+        except ChildProcessError:
+            children.clear()
+            break
+        if pid == 0:
+            break
+        children.discard(pid)
+        wait = 0
+
+    return 0
+
+# end reapChildren() -------------------------------
+
+#
+# Purpose: accept QC jobs until stopped
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: creates the socket, forks a child per job, up to maxJobs
+#	at a time
+# Throws: Nothing
+#
+def run():
+
+    if os.path.exists(socketFile):
+        os.remove(socketFile)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socketFile)
+    os.chown(socketFile, -1, grp.getgrnam(socketGroup).gr_gid)
+    os.chmod(socketFile, 0o660)
+    server.listen(16)
+
+    # wake up to probe the lookups even when there are no jobs
+    server.settimeout(min(refreshSeconds, 60))
+
+    # process ids of the running jobs
+    children = set()
+
+    print('%s listening on %s' % (time.strftime('%c'), socketFile))
+    sys.stdout.flush()
+
+    try:
+        while True:
+            # with all job slots taken, wait for a job to finish
+            reapChildren(children, len(children) >= maxJobs)
+
+            if time.time() - lastRefresh >= refreshSeconds:
+                # keep serving the lookups we have if the reload fails
+                try:
+                    refresh()
+                except Exception:
+                    traceback.print_exc()
+
+            try:
+                conn, address = server.accept()
+            except socket.timeout:
+                continue
+
+            pid = os.fork()
+            if pid == 0:
+                server.close()
+                serve(conn)
+            children.add(pid)
+            conn.close()
+    finally:
+        server.close()
+        if os.path.exists(socketFile):
+            os.remove(socketFile)
+
+    return 0
+
+# end run() -------------------------------
+
+#
+# Main
+#
+if __name__ == '__main__':
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    print('%s loading lookups' % time.strftime('%c'))
+    sys.stdout.flush()
+    refresh()
+    run()
+    sys.exit(0)
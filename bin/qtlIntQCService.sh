@@ -0,0 +1,107 @@
+#!/bin/sh
+#
+#  qtlIntQCService.sh
+###########################################################################
+#
+#  Purpose:
+#
+#      Start, stop or check the QC service (qtlIntQCService.py) that
+#      keeps the QC lookups loaded for curator QC runs
+#
+#  Usage:
+#
+#      qtlIntQCService.sh  start | stop | status
+#
+#  Env Vars:
+#
+#      See the configuration file
+#
+#  Outputs:
+#
+#      - Log file (${LOGDIR}/qtlIntQCService.log)
+#      - Process id file (${LOGDIR}/qtlIntQCService.pid)
+#      - UNIX socket (${QC_SOCKET})
+#
+#  Exit Codes:
+#
+#      0:  Successful completion
+#      1:  Fatal error occurred
+#
+#  Notes:  Curator runs (runQtlIntQC, qtlIntQC.sh) fall back to running
+#	   qtlIntQC.py when the service is not running.
+#
+###########################################################################
+
+BINDIR=`dirname $0`
+CONFIG=`cd ${BINDIR}/..; pwd`/qtlinteractionload.config
+USAGE='Usage: qtlIntQCService.sh  start | stop | status'
+
+if [ $# -ne 1 ]
+then
+    echo ${USAGE}; exit 1
+fi
+
+#
+# Make sure the configuration file exists and source it.
+#
+if [ -f ${CONFIG} ]
+then
+    . ${CONFIG}
+else
+    echo "Missing configuration file: ${CONFIG}"
+    exit 1
+fi
+
+if [ "${QC_SOCKET}" = "" ]
+then
+    echo "QC_SOCKET is not set in ${CONFIG}"
+    exit 1
+fi
+
+LOG=${LOGDIR}/qtlIntQCService.log
+PIDFILE=${LOGDIR}/qtlIntQCService.pid
+
+#
+# Is the service running?
+#
+isRunning ()
+{
+    [ -f ${PIDFILE} ] && kill -0 `cat ${PIDFILE}` 2>/dev/null
+}
+
+case "$1" in
+    start)
+	if isRunning
+	then
+	    echo "QC service is already running (`cat ${PIDFILE}`)"
+	    exit 0
+	fi
+	nohup ${PYTHON} ${QTLINTERACTIONLOAD}/bin/qtlIntQCService.py >> ${LOG} 2>&1 &
+	echo $! > ${PIDFILE}
+	echo "QC service started (`cat ${PIDFILE}`), see ${LOG}"
+	;;
+    stop)
+	if isRunning
+	then
+	    kill `cat ${PIDFILE}`
+	    echo "QC service stopped"
+	else
+	    echo "QC service is not running"
+	fi
+	rm -f ${PIDFILE}
+	;;
+    status)
+	if isRunning
+	then
+	    echo "QC service is running (`cat ${PIDFILE}`) on ${QC_SOCKET}"
+	else
+	    echo "QC service is not running"
+	    exit 1
+	fi
+	;;
+    *)
+	echo ${USAGE}; exit 1
+	;;
+esac
+
+exit 0
@@ -7,7 +7,16 @@
 #      Load QTL to QTL Interaction relationships
 #
 # Usage:
-#       qtlinteractionload.py
+#       qtlinteractionload.py  [--check-unchanged]
+#
+#       where:
+#           --check-unchanged = only determine if the input file and its
+#		resolved keys are unchanged since the last successful load
+#		(${LASTRUN_FILE}); exit 3 if so, 0 if there is work to do.
+#		qtlinteractionload.sh runs this before the QC checks. It
+#		reads only the input and ${LASTRUN_FILE}, writes no output
+#		files, and connects to the database only to resolve the
+#		keys of an unchanged input file.
 #
 #  Inputs:
 #
@@ -27,7 +36,10 @@
 #	A pipe-delimited file:
 #       	MGI_Relationship.bcp
 #
-#       Diagnostics file - for verification calls to loadlib and sourceloadlib
+#       Diagnostics file - for verification calls to loadlib and sourceloadlib,
+#	    and the phase timings (also appended to
+#	    ${LOGDIR}/qtlinteractionload.metrics); with PROFILE_RUN=true
+#	    a cProfile is saved in ${LOGDIR}/qtlinteractionload.prof
 #       Error file - for verification calls to loadlib and sourceloadlib
 #
 #  Exit Codes:
@@ -35,6 +47,7 @@
 #      0:  Successful completion
 #      1:  An exception occurred
 #      2:  bcp fails
+#      3:  --check-unchanged: nothing to load
 #
 #  Assumes:
 #
@@ -43,12 +56,24 @@
 #
 #      1) Validate the arguments to the script.
 #      2) Perform initialization steps.
-#      3) Parse input file
-#      4) Resolve MGI IDs to QTL marker keys
-#      5) Resolve interaction terms to term keys
+#      3) Parse input file; stop if the input and its resolved keys
+#	  have the same digests as the last successful load (${LASTRUN_FILE})
+#      4) Resolve MGI IDs, interaction terms and JNums to keys
+#	    through the lookup snapshot shared with the QC (${LOOKUP_CACHE});
+#	    values not in the snapshot are resolved with one set-based
+#	    query per kind
 #      5) Write out to relationship bcp
-#      6) Delete existing relationships
-#      7) BCP in new relationships:
+#	  in incremental mode (LOAD_MODE=incremental) only the relationships
+#	  not already loaded are written
+#      6) Delete existing relationships; in incremental mode only those
+#	  no longer in the input
+#      7) BCP in new relationships, record the digests in ${LASTRUN_FILE}:
+#	  in staging mode (LOAD_MODE=staging) the rows are copied into a
+#	  temp table and validated, then the delete and the insert are done
+#	  in one transaction
+#      8) Verify the load: the row count and an order-independent
+#	  checksum of the loaded relationships, from one aggregate query,
+#	  must match those of the resolved input
 #
 # History:
 #
@@ -64,6 +89,7 @@ import subprocess
 
 import mgi_utils
 import loadlib
+import qtlIntLib
 #db.setTrace()
 
 CRT = '\n'
@@ -73,6 +99,20 @@ TAB = '\t'
 inputFileName = os.getenv('INPUT_FILE_DEFAULT')
 outputDir = os.environ['OUTPUTDIR']
 
+# lookup snapshot shared with the QC
+lookupCacheFile = os.getenv('LOOKUP_CACHE')
+
+# digests of the input and of the resolved keys of the last successful load
+lastrunFileName = os.getenv('LASTRUN_FILE')
+inputDigest = None
+keyDigest = None
+
+# 'full': delete all relationships created by this load and bcp in the file
+# 'incremental': delete/insert only the relationships that changed
+# 'staging': COPY into a temp table, then replace the relationships created
+#	by this load in one short transaction
+loadMode = os.getenv('LOAD_MODE', 'full')
+
 # if 'true',bcp files will not be bcp-ed into the database.
 # Default is 'false'
 DEBUG = os.getenv('LOG_DEBUG')
@@ -80,6 +120,20 @@ DEBUG = os.getenv('LOG_DEBUG')
 bcpFile = 'MGI_Relationship.bcp'
 relationshipFileName = '%s/%s' % (outputDir, bcpFile)
 
+# 'bcpin': load the bcp file with ${PG_DBUTILS}/bin/bcpin.csh
+# 'copy': stream the rows with COPY FROM STDIN on the open connection
+bcpMethod = os.getenv('BCP_METHOD', 'bcpin')
+
+# rows per COPY batch
+copyBatchSize = int(os.getenv('COPY_BATCH_SIZE', '10000'))
+
+# if 'false' and BCP_METHOD is 'copy', the bcp file is not written
+archiveBcp = os.getenv('ARCHIVE_BCP', 'true')
+
+# phase timings, written to the diagnostics file and
+# ${LOGDIR}/qtlinteractionload.metrics
+metrics = qtlIntLib.PhaseMetrics('qtlinteractionload')
+
 #
 # File descriptors
 #
@@ -108,11 +162,30 @@ evidKey = 17396909
 # qtl interaction load user key
 userKey = 1632
 
-# database primary keys, will be set to the next available from the db
-nextRelationshipKey = 1000	# MGI_Relationship._Relationship_key
+# MGI_Relationship._Relationship_key values reserved from
+# mgi_relationship_seq once the number of rows to load is known
+keyBlock = None
 
 cdate = loadlib.loaddate
 
+# incremental load: existing relationships no longer in the input
+deleteKeyList = []
+
+# resolved input, see resolveRelationships()
+relationshipList = None
+
+# (row count, checksum) of the relationships that must be loaded once
+# the load is done, see verifyLoad()
+expectedChecksum = None
+
+# MGI_Relationship columns of the relationship tuples, for verifyLoad()
+relationshipColumns = ['_object_key_1', '_object_key_2', '_relationshipterm_key',
+    '_qualifier_key', '_evidence_key', '_refs_key']
+
+# relationships to load [(orgKey, partKey, intKey, qualKey, evidKey, refsKey), ...];
+# row i gets _Relationship_key keyBlock.keys[i] - see bcpLines()
+bcpRowList = []
+
 # Purpose: prints error 'message' if it is not None
 #     writes to log files and exits with 'status'
 # Returns: nothing
@@ -128,6 +201,7 @@ def exit(
         sys.stderr.write('\n' + str(message) + '\n')
 
     try:
+        metrics.write(fpDiagFile)
         fpDiagFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
         fpErrorFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
         fpDiagFile.close()
@@ -136,25 +210,29 @@ def exit(
     except:
         pass
 
+    metrics.save()
+    qtlIntLib.saveProfile()
+
+    # the snapshot may still be opening on the shared connection
+    qtlIntLib.waitSnapshots()
     db.useOneConnection(0)
     sys.exit(status)
 
 # end exit() -------------------------------
 
 #
-# Purpose: open files, create db connection, gets max keys from the db
+# Purpose: open files, create db connection
 # Returns: Nothing
 # Assumes: Nothing
 # Effects: Sets global variables, exits if a file can't be opened,
 #
 def initialize():
 
-    global nextRelationshipKey
-
     #
     # Open input and output files
     #
     openFiles()
+    qtlIntLib.fpDiag = fpDiagFile
 
     #
     # create database connection
@@ -169,14 +247,9 @@ def initialize():
 
     fpErrorFile.write('Start Date/Time: %s\n\n' % (mgi_utils.date()))
 
-    #
-    # get next MGI_Relationship key
-    #
-    results = db.sql('''select nextval('mgi_relationship_seq') as nextKey''', 'auto')
-    if results[0]['nextKey'] is None:
-        nextRelationshipKey = 1000
-    else:
-        nextRelationshipKey = results[0]['nextKey']
+    # the freshness probe and the snapshot file are read while the
+    # input is parsed
+    qtlIntLib.prefetchSnapshot(lookupCacheFile)
 
     return 0
 
@@ -192,16 +265,17 @@ def openFiles ():
     global fpRelationshipFile, fpInputFile, fpDiagFile, fpErrorFile
 
     try:
-        fpInputFile = open(inputFileName, 'r')
+        fpInputFile = qtlIntLib.openInput(inputFileName)
     except:
         print(('Cannot open input file: %s' % inputFileName))
         sys.exit(1)
 
-    try:
-        fpRelationshipFile = open(relationshipFileName, 'w')
-    except:
-        print(('Cannot open relationships bcp file: %s' % relationshipFileName))
-        sys.exit(1)
+    if bcpMethod != 'copy' or archiveBcp == 'true':
+        try:
+            fpRelationshipFile = open(relationshipFileName, 'w')
+        except:
+            print(('Cannot open relationships bcp file: %s' % relationshipFileName))
+            sys.exit(1)
 
     try:
         fpDiagFile = open(diagFileName, 'w')
@@ -228,48 +302,268 @@ def closeFiles ():
 
     global fpRelationshipFile, fpInputFile
 
-    fpRelationshipFile.close()
+    if fpRelationshipFile:
+        fpRelationshipFile.close()
     fpInputFile.close()
     
     return 0
 
 # end closeFiles() -------------------------------
 
-# Purpose: read input, resolve to keys, write to bcp file
+# Purpose: resolve every distinct MGI ID, interaction term and JNum
+#     in the input through the lookup snapshot shared with the QC;
+#     values the snapshot has not seen are resolved with one set-based
+#     query per kind
+# Returns: tuple of dictionaries (markerLookup, termLookup, refLookup)
+# Assumes: db connection has been initialized
+# Effects: queries a database, reads/writes the lookup snapshot
+#
+def resolveKeys(mgiIDs, terms, jNums):
+
+    metrics.start('resolveKeys')
+
+    snapshot = qtlIntLib.openSnapshot(lookupCacheFile)
+
+    # the kinds not in the snapshot are queried concurrently
+    lookups = snapshot.resolveAll({'marker' : mgiIDs, 'term' : terms, 'reference' : jNums})
+
+    results = lookups['marker']
+    markerLookup = qtlIntLib.Lookup([(mgiID, results[mgiID][0]) for mgiID in results])
+
+    termLookup = lookups['term']
+
+    refLookup = lookups['reference']
+
+    snapshot.save()
+
+    metrics.stop(len(markerLookup) + len(termLookup) + len(refLookup))
+
+    return (markerLookup, termLookup, refLookup)
+
+# end resolveKeys() -------------------------------
+
+# Purpose: compare the resolved input with the relationships currently
+#     loaded for this category
+# Returns: list of relationships to insert
+# Assumes: db connection has been initialized
+# Effects: queries a database, sets deleteKeyList to the keys of the
+#     loaded relationships that are no longer in the input
+#
+def diffRelationships(
+    relationshipList	# [(orgKey, partKey, intKey, qualKey, evidKey, refsKey), ...]
+    ):
+    global deleteKeyList
+
+    # {relationship: [_Relationship_key, ...], ...}
+    # a relationship may be loaded more than once
+    loadedDict = {}
+
+    results = db.sql('''select _relationship_key, _object_key_1, _object_key_2,
+            _relationshipterm_key, _qualifier_key, _evidence_key, _refs_key
+        from MGI_Relationship
+        where _category_key = %s
+        and _createdby_key = %s
+        order by _relationship_key ''' % (catKey, userKey), 'auto')
+
+    for r in results:
+        relationship = (r['_object_key_1'], r['_object_key_2'], r['_relationshipterm_key'],
+            r['_qualifier_key'], r['_evidence_key'], r['_refs_key'])
+        if relationship not in loadedDict:
+            loadedDict[relationship] = []
+        loadedDict[relationship].append(r['_relationship_key'])
+
+    insertList = []
+    unchanged = 0
+
+    for relationship in relationshipList:
+        keyList = loadedDict.get(relationship)
+        if keyList:
+            keyList.pop(0)
+            unchanged += 1
+        else:
+            insertList.append(relationship)
+
+    deleteKeyList = []
+    for keyList in loadedDict.values():
+        deleteKeyList.extend(keyList)
+    deleteKeyList.sort()
+
+    fpDiagFile.write('Incremental load: %s to insert, %s to delete, %s unchanged\n' % \
+        (len(insertList), len(deleteKeyList), unchanged))
+
+    return insertList
+
+# end diffRelationships() -------------------------------
+
+# Purpose: format the rows to load as bcp lines
+# Returns: generator of pipe-delimited lines
+# Assumes: processRelationships() has set bcpRowList and keyBlock
+# Effects: Nothing
+#
+def bcpLines():
+
+    # the columns that are the same on every row are formatted once
+    rowFormat = '%%s|%s|%%s|%%s|%%s|%%s|%%s|%%s|%s|%s|%s|%s\n' % \
+        (catKey, userKey, userKey, cdate, cdate)
+
+    # relationship = (orgKey, partKey, intKey, qualKey, evidKey, refsKey)
+    for (relationshipKey, relationship) in zip(keyBlock.keys, bcpRowList):
+        yield rowFormat % ((relationshipKey,) + relationship)
+
+# end bcpLines() -------------------------------
+
+# Purpose: resolve input records to keys; resolved once per run
+# Returns: list of relationships
+#     [(orgKey, partKey, intKey, qualKey, evidKey, refsKey), ...]
+# Assumes: file descriptors have been initialized
+# Effects: writes unresolved values to the error file
+#
+
+def resolveRelationships(
+    records	# parsed input [qtlIntLib.InputRow, ...], already qc'd
+    ):
+    global relationshipList
+
+    if relationshipList is not None:
+        return relationshipList
+
+    #
+    # collect the distinct IDs, terms and JNums
+    #
+    mgiIDs = set()
+    terms = set()
+    jNums = set()
+
+    for row in records:
+        # get columns 1-6, already qc'd we know there are at least 6 columns
+        (orgID, orgSym, partID, partSym, interactionType, jNum) = row.columns[:6]
+
+        mgiIDs.add(orgID)
+        mgiIDs.add(partID)
+        terms.add(interactionType)
+        jNums.add(jNum)
+
+    #
+    # resolve each kind in bulk
+    #
+    markerLookup, termLookup, refLookup = resolveKeys(mgiIDs, terms, jNums)
+
+    relationshipList = []
+
+    for row in records:
+        (orgID, orgSym, partID, partSym, interactionType, jNum) = row.columns[:6]
+        lineNum = row.lineNum
+
+        orgKey = markerLookup.get(orgID, 0)
+        if orgKey == 0:
+            fpErrorFile.write('Invalid Mouse Marker (%d) %s\n' % (lineNum, orgID))
+
+        partKey = markerLookup.get(partID, 0)
+        if partKey == 0:
+            fpErrorFile.write('Invalid Mouse Marker (%d) %s\n' % (lineNum, partID))
+
+        intKey = termLookup.get(interactionType, 0)
+        if intKey == 0:
+            fpErrorFile.write('Invalid Term (%d) %s\n' % (lineNum, interactionType))
+
+        refsKey = refLookup.get(jNum, 0)
+        if refsKey == 0:
+            fpErrorFile.write('Invalid Reference (%d): %s\n' % (lineNum, jNum))
+
+        relationshipList.append((orgKey, partKey, intKey, qualKey, evidKey, refsKey))
+
+    return relationshipList
+
+# end resolveRelationships ----------------------
+
+# Purpose: resolve input records to keys, write to bcp file
 # Returns: 1 if error,  else 0
 # Assumes: file descriptors have been initialized
 # Effects: 
 #
 
-def processRelationships():
-    global nextRelationshipKey
+def processRelationships(
+    records	# parsed input [qtlIntLib.InputRow, ...], already qc'd
+    ):
+    global keyBlock, bcpRowList, keyDigest, expectedChecksum
 
-    header = fpInputFile.readline()
-    line = fpInputFile.readline()
-    lineNum = 1
+    insertList = resolveRelationships(records)
+    keyDigest = qtlIntLib.keySetDigest(insertList)
 
-    while line:
-        lineNum += 1
+    # in every load mode the category ends up with exactly the resolved input
+    expectedChecksum = qtlIntLib.rowChecksum(insertList)
 
-        # get columns 1-6, already qc'd we know there are at least 6 columns
-        (orgID, orgSym, partID, partSym, interactionType, jNum) = list(map(str.strip, str.split(line, TAB)))[:6]
+    if loadMode == 'incremental':
+        insertList = diffRelationships(insertList)
 
-        orgKey = loadlib.verifyMarker(orgID, lineNum, fpErrorFile)
-        partKey =  loadlib.verifyMarker(partID, lineNum, fpErrorFile)
-        intKey = loadlib.verifyTerm('', 178, interactionType, lineNum, fpErrorFile)
-        refsKey = loadlib.verifyReference(jNum, lineNum, fpErrorFile)
-        fpRelationshipFile.write('%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s\n' % \
-            (nextRelationshipKey, catKey, orgKey, partKey, intKey, qualKey, evidKey, refsKey, userKey, userKey, cdate, cdate))
+    #
+    # reserve exactly the keys needed; none if there is nothing to insert,
+    # and none in debug mode since nothing is loaded
+    #
+    keyBlock = qtlIntLib.KeyBlock('mgi_relationship_seq', len(insertList),
+        reserve = DEBUG != 'true')
+    fpDiagFile.write('MGI_Relationship keys: %s%s' % (keyBlock, CRT))
 
-        nextRelationshipKey += 1
+    # the rows are formatted when written (bcpLines); the key of
+    # bcpRowList[i] is keyBlock.keys[i]
+    bcpRowList = insertList
 
-        line = fpInputFile.readline()
+    if fpRelationshipFile:
+        fpRelationshipFile.writelines(bcpLines())
         
     return 0
 
 # end processRelationships ----------------------
 
-# Purpose: deletes existing relationships
+# Purpose: determine if the input and its resolved keys are the same as
+#     in the last successful load, in which case there is nothing to do
+# Returns: 1 if unchanged, else 0
+# Assumes: db connection has been initialized
+# Effects: sets inputDigest and keyDigest; resolves the records to keys
+#     only if the input digest is unchanged
+#
+def isUnchanged(
+    records	# parsed input [qtlIntLib.InputRow, ...]
+    ):
+    global inputDigest, keyDigest
+
+    inputDigest = qtlIntLib.inputDigest(records)
+
+    lastrun = qtlIntLib.readDigests(lastrunFileName)
+    if lastrun.get('input') != inputDigest:
+        return 0
+
+    keyDigest = qtlIntLib.keySetDigest(resolveRelationships(records))
+    if lastrun.get('keys') != keyDigest:
+        return 0
+
+    msg = 'no-op: input file and resolved keys unchanged since the last load (%s)' % lastrunFileName
+    fpDiagFile.write(msg + CRT)
+    print(msg)
+
+    return 1
+
+# end isUnchanged() -------------------------------------
+
+# Purpose: record the digests of the input and the resolved keys
+#     after a successful load
+# Returns: None
+# Assumes: isUnchanged() and processRelationships() have been run
+# Effects: writes the lastrun file
+#
+def writeLastrun():
+
+    if DEBUG  == 'true':
+        return 0
+
+    qtlIntLib.writeDigests(lastrunFileName, {'input' : inputDigest, 'keys' : keyDigest})
+
+    return 0
+
+# end writeLastrun() -------------------------------------
+
+# Purpose: deletes existing relationships; in incremental mode only those
+#     no longer in the input
 # Returns: None
 # Assumes: None
 # Effects: None
@@ -279,9 +573,22 @@ def doDeletes():
     if DEBUG  == 'true':
         return 0
 
-    db.sql('''delete from MGI_Relationship where _CreatedBy_key = %s ''' % userKey, None)
+    # the staging load deletes in the same transaction as the insert
+    if loadMode == 'staging':
+        return 0
+
+    if loadMode == 'incremental':
+        for i in range(0, len(deleteKeyList), qtlIntLib.batchSize):
+            db.sql('''delete from MGI_Relationship where _Relationship_key in (%s) ''' % \
+                ','.join(map(str, deleteKeyList[i:i + qtlIntLib.batchSize])), None)
+    else:
+        db.sql('''delete from MGI_Relationship where _CreatedBy_key = %s ''' % userKey, None)
     db.commit()
-    db.useOneConnection(0)
+
+    # COPY uses the open connection
+    if bcpMethod != 'copy':
+        qtlIntLib.waitSnapshots()
+        db.useOneConnection(0)
 
     return 0
 
@@ -297,6 +604,62 @@ def bcpFiles():
     if DEBUG  == 'true':
         return 0
 
+    if loadMode == 'staging':
+        return stageRelationships()
+
+    if bcpMethod == 'copy':
+        statusCode = copyRelationships()
+        if statusCode != 0:
+            return statusCode
+    else:
+        statusCode = bcpinRelationships()
+        if statusCode != 0:
+            return statusCode
+
+    # the keys were reserved from mgi_relationship_seq, no setval is needed
+
+    return 0
+
+# end bcpFiles() -------------------------------------
+
+# Purpose: verify what landed in MGI_Relationship: the row count and
+#     checksum of the relationships created by this load must match
+#     those computed by processRelationships()
+# Returns: 1 if they do not match, else 0
+# Assumes: bcpFiles() has been run
+# Effects: queries a database
+#
+def verifyLoad():
+
+    if DEBUG  == 'true':
+        return 0
+
+    results = db.sql('''select count(*) as rowCount, %s as checksum
+        from MGI_Relationship
+        where _category_key = %s
+        and _createdby_key = %s ''' % \
+        (qtlIntLib.checksumSql(relationshipColumns), catKey, userKey), 'auto')
+
+    loaded = (results[0]['rowCount'], int(results[0]['checksum']))
+
+    fpDiagFile.write('Verify MGI_Relationship (rows, checksum): loaded %s, expected %s%s' % \
+        (loaded, expectedChecksum, CRT))
+
+    if loaded != expectedChecksum:
+        fpDiagFile.write('MGI_Relationship does not verify%s' % CRT)
+        return 1
+
+    return 0
+
+# end verifyLoad() -------------------------------------
+
+# Purpose: loads the bcp file with bcpin.csh
+# Returns: bcpin.csh status code
+# Assumes: the bcp file has been written and closed
+# Effects: None
+#
+def bcpinRelationships():
+
     bcpCommand = os.environ['PG_DBUTILS'] + '/bin/bcpin.csh'
 
     bcpCmd = '%s %s %s %s %s %s "|" "\\n" mgd' % \
@@ -312,44 +675,187 @@ def bcpFiles():
         fpDiagFile.write(msg)
         return statusCode
 
-    # update mgi_relationship auto-sequence
-    db.sql(''' select setval('mgi_relationship_seq', (select max(_Relationship_key) from MGI_Relationship)) ''', None)
+    return 0
+
+# end bcpinRelationships() -------------------------------------
+
+# Purpose: streams the rows into MGI_Relationship with COPY FROM STDIN
+#     on the open connection, in batches of copyBatchSize rows
+# Returns: 1 if the number of rows copied does not match, else 0
+# Assumes: db connection is open
+# Effects: inserts into the database
+#
+def copyRelationships():
+
+    rowCount = qtlIntLib.copyIn('''COPY mgd.MGI_Relationship FROM STDIN WITH (FORMAT text, DELIMITER '|')''',
+        bcpLines(), copyBatchSize, fpDiagFile)
+    db.commit()
+
+    fpDiagFile.write('COPY MGI_Relationship: %s rows%s' % (rowCount, CRT))
+
+    if rowCount != len(bcpRowList):
+        fpDiagFile.write('COPY MGI_Relationship: expected %s rows%s' % (len(bcpRowList), CRT))
+        return 1
 
     return 0
 
-# end bcpFiles() -------------------------------------
+# end copyRelationships() -------------------------------------
+
+# Purpose: COPY the rows into a temp table, validate them there, then
+#     replace the relationships created by this load in one transaction
+# Returns: 1 if the staged rows do not validate, else 0
+# Assumes: db connection is open
+# Effects: deletes from and inserts into the database
+#
+def stageRelationships():
+
+    stageTable = 'qtlint_relationship_stage'
+
+    db.sql('''create temp table %s (like mgd.MGI_Relationship including defaults)''' % stageTable, None)
+
+    rowCount = qtlIntLib.copyIn('''COPY %s FROM STDIN WITH (FORMAT text, DELIMITER '|')''' % stageTable,
+        bcpLines(), copyBatchSize, fpDiagFile)
+
+    results = db.sql('''select count(*) as rowCount,
+            min(_relationship_key) as minKey, max(_relationship_key) as maxKey
+        from %s ''' % stageTable, 'auto')
+    db.commit()
+
+    fpDiagFile.write('COPY %s: %s rows%s' % (stageTable, rowCount, CRT))
+
+    expected = (len(bcpRowList), keyBlock.first, keyBlock.last)
+
+    staged = (results[0]['rowCount'], results[0]['minKey'], results[0]['maxKey'])
+
+    if rowCount != expected[0] or staged != expected:
+        fpDiagFile.write('%s does not validate: staged (rows, min key, max key) %s, expected %s%s' % \
+            (stageTable, staged, expected, CRT))
+        return 1
+
+    #
+    # swap in one short transaction; the keys were reserved from
+    # mgi_relationship_seq, no setval is needed
+    #
+    db.sql('''delete from MGI_Relationship where _CreatedBy_key = %s ''' % userKey, None)
+    db.sql('''insert into MGI_Relationship select * from %s ''' % stageTable, None)
+    db.commit()
+
+    db.sql('''drop table %s ''' % stageTable, None)
+    db.commit()
+
+    fpDiagFile.write('MGI_Relationship: replaced with %s staged rows%s' % (rowCount, CRT))
+
+    return 0
+
+# end stageRelationships() -------------------------------------
+
+# Purpose: --check-unchanged: determine if the input and its resolved
+#     keys are the same as in the last successful load, without opening
+#     the bcp, diagnostics or error files of the load
+# Returns: 1 if unchanged, else 0
+# Assumes: Nothing
+# Effects: reads the input and lastrun files; queries a database only if
+#     the input digest is unchanged
+#
+def checkUnchanged():
+    global fpInputFile, fpDiagFile, fpErrorFile
+
+    try:
+        fpInputFile = qtlIntLib.openInput(inputFileName)
+    except:
+        print(('Cannot open input file: %s' % inputFileName))
+        sys.exit(1)
+
+    records = qtlIntLib.readRecords(fpInputFile)
+    fpInputFile.close()
+
+    # a changed input needs no keys
+    lastrun = qtlIntLib.readDigests(lastrunFileName)
+    if lastrun.get('input') != qtlIntLib.inputDigest(records):
+        return 0
+
+    # the load reports the unresolved values
+    fpDiagFile = fpErrorFile = open(os.devnull, 'w')
+
+    db.useOneConnection(1)
+    try:
+        unchanged = isUnchanged(records)
+    finally:
+        qtlIntLib.waitSnapshots()
+        db.useOneConnection(0)
+
+    return unchanged
+
+# end checkUnchanged() -------------------------------------
 
 #
 # Main
 #
 
-print('%s' % mgi_utils.date())
-print ('initialize()')
-if initialize() != 0:
-    exit(1, 'Error in  initialize \n' )
-
-print('%s' % mgi_utils.date())
-print('processRelationships()')
-# process qtl interactions file, write to bcp
-if processRelationships() != 0:
-    exit(1, 'Error in  processRelationships \n' )
-
-print('%s' % mgi_utils.date())
-print('doDeletes()')
-# delete existing relationships
-if doDeletes() != 0:
-    exit(1, 'Error in  doDeletes \n' )
-
-print('%s' % mgi_utils.date())
-print('closeFiles()')
-# close all output files
-if closeFiles() != 0:
-    exit(1, 'Error in  closeFiles \n' )
-
-print('%s' % mgi_utils.date())
-print('bcpFiles()')
-# bcp the relationships
-if bcpFiles() != 0:
-    exit(1, 'Error in  bcpFiles \n' )
-
-exit(0, 'qtlinteractionload successful')
+if __name__ == '__main__':
+
+    if sys.argv[1:] == ['--check-unchanged']:
+        if checkUnchanged():
+            print('qtlinteractionload: no changes to load')
+            sys.exit(3)
+        print('qtlinteractionload: input file or resolved keys changed')
+        sys.exit(0)
+    elif sys.argv[1:]:
+        print('Usage: qtlinteractionload.py  [--check-unchanged]')
+        sys.exit(1)
+
+    qtlIntLib.startProfile('qtlinteractionload')
+
+    print('%s' % mgi_utils.date())
+    print ('initialize()')
+    metrics.start('initialize')
+    if initialize() != 0:
+        exit(1, 'Error in  initialize \n' )
+
+    records = qtlIntLib.readRecords(fpInputFile)
+    metrics.stop(len(records))
+
+    if isUnchanged(records):
+        exit(0, 'qtlinteractionload successful - no changes to load')
+
+    print('%s' % mgi_utils.date())
+    print('processRelationships()')
+    # process qtl interactions file, write to bcp
+    metrics.start('processRelationships')
+    if processRelationships(records) != 0:
+        exit(1, 'Error in  processRelationships \n' )
+    metrics.stop(len(bcpRowList))
+
+    print('%s' % mgi_utils.date())
+    print('doDeletes()')
+    # delete existing relationships
+    metrics.start('doDeletes')
+    if doDeletes() != 0:
+        exit(1, 'Error in  doDeletes \n' )
+    metrics.stop(len(deleteKeyList))
+
+    print('%s' % mgi_utils.date())
+    print('closeFiles()')
+    # close all output files
+    if closeFiles() != 0:
+        exit(1, 'Error in  closeFiles \n' )
+
+    print('%s' % mgi_utils.date())
+    print('bcpFiles()')
+    # bcp the relationships
+    metrics.start('bcpFiles')
+    if bcpFiles() != 0:
+        exit(1, 'Error in  bcpFiles \n' )
+    metrics.stop(len(bcpRowList))
+
+    print('%s' % mgi_utils.date())
+    print('verifyLoad()')
+    # verify the loaded relationships
+    metrics.start('verifyLoad')
+    if verifyLoad() != 0:
+        exit(1, 'Error in  verifyLoad - see %s \n' % diagFileName)
+    metrics.stop(expectedChecksum[0])
+
+    writeLastrun()
+
+    exit(0, 'qtlinteractionload successful')
@@ -61,63 +61,86 @@ preload ${OUTPUTDIR}
 
 cleanDir ${OUTPUTDIR}
 
-# There should be a "lastrun" file in the input directory that was created
-# the last time the load was run for this input file. If this file exists
-# and is more recent than the input file, the load does not need to be run.
 #
-LASTRUN_FILE=${INPUTDIR}/lastrun
-if [ -f ${LASTRUN_FILE} ]
+# The load records digests of the input file and of its resolved keys in
+# ${LASTRUN_FILE} after each successful run; if neither has changed the
+# load writes a "no-op" line to the diagnostics log and the QC checks
+# and the load are skipped.
+#
+
+if [ "${QC_LOAD_SINGLE_PASS}" = "true" ]
 then
-    if test ${LASTRUN_FILE} -nt ${INPUT_FILE_DEFAULT}
+    #
+    # run the QC checks and the load in one pass over the input
+    #
+    echo "" >> ${LOG_DIAG}
+    date >> ${LOG_DIAG}
+    echo "Run qtlIntQCLoad.py"  | tee -a ${LOG_DIAG}
+    ${PYTHON} ${QTLINTERACTIONLOAD}/bin/qtlIntQCLoad.py >> ${LOG_DIAG} 2>&1
+    STAT=$?
+    if [ ${STAT} -eq 2 ]
     then
+        checkStatus ${STAT} "QC errors detected. The load will not run. See ${QC_RPT}. qtlIntQCLoad.py"
 
-        echo "Input file has not been updated - skipping load" | tee -a ${LOG_PROC}
+        # run postload cleanup and email logs
+        shutDown
+    fi
+    checkStatus ${STAT} "${QTLINTERACTIONLOAD}/bin/qtlIntQCLoad.py"
+else
+    #
+    # skip the QC checks if there is nothing to load
+    #
+    echo "" >> ${LOG_DIAG}
+    date >> ${LOG_DIAG}
+    echo "Check for changes since the last load"  | tee -a ${LOG_DIAG}
+    # without a last run there is nothing to compare with
+    STAT=0
+    if [ -f "${LASTRUN_FILE}" ]
+    then
+        ${PYTHON} ${QTLINTERACTIONLOAD}/bin/qtlinteractionload.py --check-unchanged >> ${LOG_DIAG} 2>&1
+        STAT=$?
+    fi
+    if [ ${STAT} -eq 3 ]
+    then
+        echo "Input file and resolved keys have not changed - skipping load" | tee -a ${LOG_PROC}
         # set STAT for shutdown
         STAT=0
-        echo 'shutting down'
         shutDown
         exit 0
     fi
-fi
-
-echo "" >> ${LOG_DIAG}
-date >> ${LOG_DIAG}
-echo "Run QC checks"  | tee -a ${LOG_DIAG}
-${QTLINTERACTIONLOAD}/bin/qtlIntQC.sh ${INPUT_FILE_DEFAULT} live
-STAT=$?
-if [ ${STAT} -eq 1 ]
-then
-    checkStatus ${STAT} "An error occurred while generating the QC reports - See ${QC_LOGFILE}. qtlIntQC.sh"
-
-    # run postload cleanup and email logs
-    shutDown
-fi
+    checkStatus ${STAT} "${QTLINTERACTIONLOAD}/bin/qtlinteractionload.py --check-unchanged"
+
+    echo "" >> ${LOG_DIAG}
+    date >> ${LOG_DIAG}
+    echo "Run QC checks"  | tee -a ${LOG_DIAG}
+    ${QTLINTERACTIONLOAD}/bin/qtlIntQC.sh ${INPUT_FILE_DEFAULT} live
+    STAT=$?
+    if [ ${STAT} -eq 1 ]
+    then
+        checkStatus ${STAT} "An error occurred while generating the QC reports - See ${QC_LOGFILE}. qtlIntQC.sh"
 
-if [ ${STAT} -eq 2 ]
-then
-    checkStatus ${STAT} "QC errors detected. The load will not run. See ${QC_RPT}. qtlIntQC.sh"
+        # run postload cleanup and email logs
+        shutDown
+    fi
 
-    # run postload cleanup and email logs
-    shutDown
+    if [ ${STAT} -eq 2 ]
+    then
+        checkStatus ${STAT} "QC errors detected. The load will not run. See ${QC_RPT}. qtlIntQC.sh"
 
-fi
+        # run postload cleanup and email logs
+        shutDown
 
-#
-# run the load
-#
-echo "" >> ${LOG_DIAG}
-date >> ${LOG_DIAG}
-echo "Run qtlinteractionload.py"  | tee -a ${LOG_DIAG}
-${PYTHON} ${QTLINTERACTIONLOAD}/bin/qtlinteractionload.py | tee -a ${LOG_DIAG}
-STAT=$?
-checkStatus ${STAT} "${QTLINTERACTIONLOAD}/bin/qtlinteractionload.py"
+    fi
 
-#
-# Touch the "lastrun" file to note when the load was run.
-#
-if [ ${STAT} = 0 ]
-then
-    touch ${LASTRUN_FILE}
+    #
+    # run the load
+    #
+    echo "" >> ${LOG_DIAG}
+    date >> ${LOG_DIAG}
+    echo "Run qtlinteractionload.py"  | tee -a ${LOG_DIAG}
+    ${PYTHON} ${QTLINTERACTIONLOAD}/bin/qtlinteractionload.py >> ${LOG_DIAG} 2>&1
+    STAT=$?
+    checkStatus ${STAT} "${QTLINTERACTIONLOAD}/bin/qtlinteractionload.py"
 fi
 
 # run postload cleanup and email logs